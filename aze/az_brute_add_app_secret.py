@@ -4,6 +4,7 @@ import json
 from . import profile
 from .tokens import search_token_for_subscription
 from . import arm_api, graph_api
+from . import http_session
 from .error import AzeRequestError
 import logging
 
@@ -35,7 +36,11 @@ def main():
         scopes=["https://graph.microsoft.com//.default"]
     )
     access_token_raw = access_token_obj["secret"]
-    applications = graph_api.list_applications(access_token_raw)
+    applications = graph_api.iter_applications(
+        access_token_raw,
+        select=["id", "appId", "displayName"],
+        top=graph_api.MAX_PAGE_SIZE,
+    )
 
     for app in applications:
         try:
@@ -52,6 +57,8 @@ def main():
         except AzeRequestError as e:
             logging.debug("Error {}".format(e))
 
+    http_session.log_stats()
+
 
 def init_log(verbosity=0, log_file=None):
 
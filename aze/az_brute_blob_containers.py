@@ -1,16 +1,21 @@
 import argparse
-from concurrent.futures import ThreadPoolExecutor
+from .executor import BoundedExecutor
 from threading import Lock
 import sys
 import logging
 from . import read_in
 from .permutations import DEFAULT_PERMUTATIONS
-import requests
-from xml.etree import ElementTree
+from . import http_session
+from . import storage_api
+from .error import AzeRequestError
+from .az_brute_service_subdomains import domain_exists
+from .dns_cache import DnsResolutionCache
+import dns.resolver
 
 logger = logging.getLogger("aze")
 
 DEFAULT_WORKERS = 2
+BLOB_SERVICE_DOMAIN = "blob.core.windows.net"
 
 def parse_args():
     parser = argparse.ArgumentParser(
@@ -19,7 +24,8 @@ def parse_args():
     parser.add_argument(
         "blobs",
         nargs="*",
-        help="Specify blob domains or files. If None then stdin is used"
+        help="Specify blob domains (or storage account names) or files."
+        " If None then stdin is used"
     )
 
     parser.add_argument(
@@ -36,6 +42,19 @@ def parse_args():
         " If none, default wordlist will be used.",
     )
 
+    parser.add_argument(
+        "-l", "--list",
+        action="store_true",
+        help="List all the files of the containers found (shown with -vv).",
+    )
+
+    parser.add_argument(
+        "--no-dns-check",
+        action="store_true",
+        help="Probe containers of blob domains without checking first that"
+        " they resolve.",
+    )
+
     parser.add_argument(
         "--timeout",
         type=int,
@@ -59,7 +78,11 @@ def main():
     args = parse_args()
     init_log(args.verbose)
 
-    pool = ThreadPoolExecutor(args.workers)
+    http_session.configure_session(
+        pool_size=args.workers,
+        timeout=args.timeout,
+    )
+    pool = BoundedExecutor(args.workers)
     print_lock = Lock()
 
     if args.wordlist:
@@ -71,49 +94,96 @@ def main():
     else:
         words = DEFAULT_PERMUTATIONS
 
-    timeout = args.timeout
+    blob_domains = (
+        to_blob_domain(target)
+        for target in read_in.read_text_targets(args.blobs)
+    )
+    if not args.no_dns_check:
+        resolver = dns.resolver.Resolver()
+        resolver.timeout = args.timeout
+        blob_domains = filter_existing_domains(blob_domains, resolver)
 
     try:
-        for blob_domain in read_in.read_text_targets(args.blobs):
+        # Candidates of the same account are submitted together, so they
+        # reuse the keep-alive connections of its host pool
+        for blob_domain in blob_domains:
             for word in words:
                 pool.submit(
                     check_blob,
                     blob_domain,
                     word,
-                    timeout,
                     print_lock,
+                    args.list,
                 )
     except (KeyboardInterrupt, BrokenPipeError):
         pass
-
-def check_blob(blob_domain, folder, timeout, print_lock):
+    finally:
+        pool.shutdown()
+        http_session.log_stats()
+
+def to_blob_domain(target):
+    if "." not in target:
+        return "{}.{}".format(target, BLOB_SERVICE_DOMAIN)
+    return target
+
+def filter_existing_domains(domains, resolver, tcp=False):
+    """Yield the domains except those that don't exist (NXDOMAIN), so no
+    requests are wasted in storage accounts that don't exist. Domains
+    that can't be resolved because of resolver errors are kept, to not
+    miss real accounts.
+    """
+    cache = DnsResolutionCache()
+    for domain in domains:
+        zone = domain.split(".", 1)[1]
+        try:
+            exists = domain_exists(domain, zone, resolver, tcp, cache)
+        except Exception as ex:
+            logger.warning(
+                "Error %s resolving '%s', checking it anyway: %s",
+                type(ex).__name__, domain, ex
+            )
+            exists = True
+
+        if exists:
+            yield domain
+        else:
+            logging.info("Skipping {}, domain doesn't exist".format(domain))
+
+def check_blob(blob_domain, folder, print_lock, list_files=False):
     url = "https://{}/{}".format(blob_domain, folder).lower()
     logging.info("Checking {}".format(url))
-    resp = requests.get(
-        url,
-        params={
-            "restype": "container",
-            "comp": "list"
-        },
-        timeout=timeout
-    )
 
+    # A single result is enough to know if the container is public. The
+    # small body is always read so the connection can be reused.
+    # Probes are not retried, as the other bruteforce tools
+    resp = storage_api.request_container_files(
+        url, maxresults=1, retry_policy=None
+    )
     if resp.status_code != 200:
         return
 
     with print_lock:
         print(url)
 
-    filenames = extract_filenames(resp.text)
-    logging.info("{} {} files found: {}".format(
-        url,
-        len(filenames),
-        ",".join(filenames)
-    ))
+    if list_files:
+        try:
+            filenames = list_filenames(url)
+        except AzeRequestError as e:
+            logging.warning("{}".format(e))
+            return
+
+        logging.info("{} {} files found: {}".format(
+            url,
+            len(filenames),
+            ",".join(filenames)
+        ))
 
-def extract_filenames(text):
-    root = ElementTree.fromstring(text)
-    return [n.text for n in root.findall("./Blobs/Blob/Name")]
+def list_filenames(url):
+    return [
+        blob["name"]
+        for blob in storage_api.list_blobs(url)
+        if blob["type"] == "blob"
+    ]
 
 def init_log(verbosity=0, log_file=None):
 
@@ -5,7 +5,7 @@ from concurrent.futures import ThreadPoolExecutor, as_completed
 from threading import Lock
 from . import read_in
 import logging
-import requests
+from . import http_session
 
 logger = logging.getLogger("aze")
 
@@ -72,6 +72,7 @@ def main():
     init_log(args.verbose)
 
     state = AzureBruteState()
+    http_session.configure_session(pool_size=args.workers)
     pool = ThreadPoolExecutor(args.workers)
     threads = []
 
@@ -320,7 +321,7 @@ def login_with_user_password(base_url, user, password):
 
     url = "{}/common/oauth2/token".format(base_url)
     logging.debug('Trying %s:%s' % (user, password))
-    resp = requests.post(url, data=data, headers=headers)
+    resp = http_session.post(url, data=data, headers=headers)
     if resp.status_code == 200:
         error_code = 0
         description = ""
@@ -1,11 +1,19 @@
 import argparse
+import asyncio
+import itertools
 import dns.resolver
+import dns.asyncresolver
+import dns.exception
 import dns
-from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import re
+from .executor import BoundedExecutor
 from threading import Lock
 import sys
 import logging
+import uuid
 from . import read_in
+from .dns_cache import DnsResolutionCache, DEFAULT_TTL, parent_domain
 from .permutations import DEFAULT_PERMUTATIONS
 
 logger = logging.getLogger("aze")
@@ -78,6 +86,9 @@ SERVICE_KEYWORDS =  {
 }
 
 DEFAULT_WORKERS = 2
+MAX_DOMAIN_LENGTH = 253
+LABEL_REGEX = re.compile(r"^(?!-)[a-z0-9-]{1,63}(?<!-)$")
+DEFAULT_CONCURRENCY = 500
 
 def parse_args():
     parser = argparse.ArgumentParser(
@@ -96,6 +107,37 @@ def parse_args():
         help="Number of concurrent workers. Default: {}".format(DEFAULT_WORKERS)
     )
 
+    parser.add_argument(
+        "--async",
+        dest="use_async",
+        action="store_true",
+        help="Use the asyncio engine, that keeps many queries in flight"
+        " from a single thread, instead of the workers.",
+    )
+
+    parser.add_argument(
+        "-c", "--concurrency",
+        default=DEFAULT_CONCURRENCY,
+        type=int,
+        help="Max number of queries in flight with --async. Each query uses"
+        " a socket, so keep it below the open files limit."
+        " Default: {}".format(DEFAULT_CONCURRENCY)
+    )
+
+    parser.add_argument(
+        "-r", "--rate",
+        default=0,
+        type=float,
+        help="Max queries per second sent to each nameserver with --async."
+        " Default: no limit",
+    )
+
+    parser.add_argument(
+        "-n", "--nameservers",
+        nargs="*",
+        help="Nameservers to use. If none, system nameservers are used.",
+    )
+
     parser.add_argument(
         "-p", "--permutations",
         nargs="*",
@@ -129,6 +171,20 @@ def parse_args():
         help="Timeout milliseconds, default 5000"
     )
 
+    parser.add_argument(
+        "--cache",
+        help="File to persist resolutions between runs, so domains already"
+        " resolved are not queried again until the cache ttl expires.",
+    )
+
+    parser.add_argument(
+        "--cache-ttl",
+        type=int,
+        default=DEFAULT_TTL,
+        help="Seconds to keep resolutions in cache."
+        " Default: {}".format(DEFAULT_TTL),
+    )
+
     parser.add_argument(
         "-v", "--verbose",
         action="count",
@@ -145,11 +201,6 @@ def main():
     args = parse_args()
     init_log(args.verbose)
 
-    pool = ThreadPoolExecutor(args.workers)
-    print_lock = Lock()
-
-    resolver = dns.resolver.Resolver()
-    resolver.timeout = args.timeout
     tcp=args.tcp
 
     if args.permutations:
@@ -170,12 +221,44 @@ def main():
     else:
         service_domains = set(SERVICE_DOMAIN_NAMES.keys())
 
+    cache = DnsResolutionCache(args.cache, ttl=args.cache_ttl)
+
+    resolver = dns.resolver.Resolver()
+    resolver.timeout = args.timeout
+    if args.nameservers:
+        resolver.nameservers = args.nameservers
+
+    candidates_filter = CandidatesFilter()
     try:
-        for subdomain in read_in.read_text_targets(args.subdomains):
-            for service_domain in service_domains:
-                for subdomain_perm in apply_permutations(
-                        subdomain, permutations
-                ):
+        service_domains = [
+            service_domain
+            for service_domain in service_domains
+            if not is_wildcard_zone(service_domain, resolver, tcp, cache)
+        ]
+
+        candidates = gen_candidates(
+            read_in.read_text_targets(args.subdomains),
+            service_domains,
+            permutations,
+            candidates_filter,
+        )
+
+        if args.use_async:
+            resolvers = [
+                AsyncRateLimitedResolver(nameserver, args.timeout, args.rate)
+                for nameserver in get_nameservers(args.nameservers)
+            ]
+            asyncio.run(async_resolve_candidates(
+                candidates,
+                resolvers,
+                tcp,
+                args.concurrency,
+                cache,
+            ))
+        else:
+            print_lock = Lock()
+            with BoundedExecutor(args.workers) as pool:
+                for subdomain_perm, service_domain in candidates:
                     pool.submit(
                         dns_resolution,
                         subdomain_perm,
@@ -183,9 +266,75 @@ def main():
                         resolver,
                         tcp,
                         print_lock,
+                        cache,
                     )
     except (KeyboardInterrupt, BrokenPipeError):
         pass
+    finally:
+        cache.save()
+        logger.info("Resolutions taken from cache: %d", cache.hits)
+        logger.info(
+            "Queries saved: %d duplicated, %d invalid",
+            candidates_filter.duplicated_queries,
+            candidates_filter.invalid_queries,
+        )
+
+def gen_candidates(
+        subdomains, service_domains, permutations, candidates_filter=None
+):
+    candidates_filter = candidates_filter or CandidatesFilter()
+    service_domains = list(service_domains)
+    for subdomain in subdomains:
+        for subdomain_perm in apply_permutations(subdomain, permutations):
+            subdomain_perm = candidates_filter.check(
+                subdomain_perm, len(service_domains)
+            )
+            if not subdomain_perm:
+                continue
+
+            for service_domain in service_domains:
+                if len(subdomain_perm) + 1 + len(service_domain) \
+                   > MAX_DOMAIN_LENGTH:
+                    candidates_filter.invalid_queries += 1
+                    continue
+                yield subdomain_perm, service_domain
+
+
+class CandidatesFilter:
+    """Normalizes subdomain candidates and discards the ones that are not
+    valid hostnames or were already generated. Seen candidates are
+    stored as 8 bytes digests, so memory per candidate is constant no
+    matter the length of the name.
+    """
+
+    def __init__(self):
+        self._seen = set()
+        self.duplicated_queries = 0
+        self.invalid_queries = 0
+
+    def check(self, subdomain, queries=1):
+        """Return the normalized subdomain, or None if it must be skipped.
+        queries is the number of queries each candidate produces, to
+        count the ones saved.
+        """
+        subdomain = subdomain.strip().strip(".").lower()
+        if not is_valid_hostname(subdomain):
+            logger.debug("Skipping invalid subdomain '%s'", subdomain)
+            self.invalid_queries += queries
+            return None
+
+        digest = hashlib.blake2b(subdomain.encode(), digest_size=8).digest()
+        if digest in self._seen:
+            self.duplicated_queries += queries
+            return None
+
+        self._seen.add(digest)
+        return subdomain
+
+def is_valid_hostname(name):
+    if not name or len(name) > MAX_DOMAIN_LENGTH:
+        return False
+    return all(LABEL_REGEX.match(label) for label in name.split("."))
 
 def apply_permutations(base, permutations):
     yield base
@@ -195,20 +344,13 @@ def apply_permutations(base, permutations):
         yield word + base
         yield base + word
 
-def dns_resolution(subdomain, service_domain, resolver, tcp, print_lock):
+def dns_resolution(
+        subdomain, service_domain, resolver, tcp, print_lock, cache
+):
     domain = subdomain + "." + service_domain
-    found = False
     try:
         logging.info("Checking {}".format(domain))
-        resolve_record("SOA", domain, resolver, tcp)
-        found = True
-    except dns.resolver.NXDOMAIN:
-        pass
-    except dns.resolver.NoAnswer:
-        # This means that there is no specific answer for the SOA query
-        # but there is an answer so we are good.
-        found = True
-        pass
+        found = domain_exists(domain, service_domain, resolver, tcp, cache)
     except Exception as ex:
         logger.warning(
             "Error %s resolving '%s': %s",
@@ -218,11 +360,68 @@ def dns_resolution(subdomain, service_domain, resolver, tcp, print_lock):
 
     if found:
         with print_lock:
-            logger.info("Service '{}' domain found: {}".format(
-                SERVICE_DOMAIN_NAMES[service_domain],
-                domain
-            ))
-            print(domain)
+            report_domain(domain, service_domain)
+
+def domain_exists(domain, zone, resolver, tcp, cache, shared=False):
+    exists = cache.get(domain, zone)
+    if exists is not None:
+        return exists
+
+    # If the parent name doesn't exist, neither do its subdomains, so
+    # the parent is resolved (and cached) once for all its children
+    parent = parent_domain(domain, zone)
+    if parent and not domain_exists(
+            parent, zone, resolver, tcp, cache, shared=True
+    ):
+        return False
+
+    try:
+        resolve_record("SOA", domain, resolver, tcp)
+        exists = True
+    except dns.resolver.NXDOMAIN:
+        exists = False
+    except dns.resolver.NoAnswer:
+        # This means that there is no specific answer for the SOA query
+        # but there is an answer so we are good.
+        exists = True
+
+    cache.set(domain, exists, shared=shared)
+    return exists
+
+def is_wildcard_zone(zone, resolver, tcp, cache):
+    """Check if a random name under zone resolves, which means that any
+    name would resolve and the zone cannot be bruteforced.
+    """
+    is_wildcard = cache.get_wildcard(zone)
+    if is_wildcard is None:
+        random_domain = "aze-{}.{}".format(uuid.uuid4().hex, zone)
+        try:
+            resolve_record("SOA", random_domain, resolver, tcp)
+            is_wildcard = True
+        except dns.resolver.NXDOMAIN:
+            is_wildcard = False
+        except dns.resolver.NoAnswer:
+            is_wildcard = True
+        except dns.exception.DNSException as ex:
+            # Not cached, the zone may be checked right in a later run
+            logger.warning(
+                "Unable to check if '%s' is a wildcard zone: %s", zone, ex
+            )
+            return False
+        cache.set_wildcard(zone, is_wildcard)
+
+    if is_wildcard:
+        logger.warning(
+            "Skipping '%s' since it resolves any subdomain (wildcard)", zone
+        )
+    return is_wildcard
+
+def report_domain(domain, service_domain):
+    logger.info("Service '{}' domain found: {}".format(
+        SERVICE_DOMAIN_NAMES[service_domain],
+        domain
+    ))
+    print(domain)
 
 def resolve_record(q_type, host, resolver, tcp):
     logger.debug("Resolving '%s' records %s", q_type, host)
@@ -230,6 +429,103 @@ def resolve_record(q_type, host, resolver, tcp):
     return [str(d) for d in results]
 
 
+def get_nameservers(nameservers=None):
+    if nameservers:
+        return nameservers
+    return dns.resolver.Resolver().nameservers
+
+
+async def async_resolve_candidates(
+        candidates, resolvers, tcp, concurrency, cache
+):
+    """Resolve the candidates with a fixed number of worker coroutines
+    that pull from the same candidates iterator, so no more than
+    concurrency queries are in flight and candidates are only generated
+    when a worker is free. Queries are spread between the resolvers in
+    round robin.
+    """
+    resolvers = itertools.cycle(resolvers)
+
+    async def worker():
+        for subdomain, service_domain in candidates:
+            await async_dns_resolution(
+                subdomain, service_domain, next(resolvers), tcp, cache
+            )
+
+    await asyncio.gather(*[worker() for _ in range(max(concurrency, 1))])
+
+async def async_dns_resolution(
+        subdomain, service_domain, resolver, tcp, cache
+):
+    domain = subdomain + "." + service_domain
+    found = False
+    try:
+        logging.info("Checking {}".format(domain))
+        found = await async_domain_exists(
+            domain, service_domain, resolver, tcp, cache
+        )
+    except Exception as ex:
+        # A failed query must not stop the worker that made it
+        logger.warning(
+            "Error %s resolving '%s': %s",
+            type(ex).__name__, domain, ex
+        )
+
+    if found:
+        report_domain(domain, service_domain)
+
+async def async_domain_exists(domain, zone, resolver, tcp, cache, shared=False):
+    exists = cache.get(domain, zone)
+    if exists is not None:
+        return exists
+
+    parent = parent_domain(domain, zone)
+    if parent and not await async_domain_exists(
+            parent, zone, resolver, tcp, cache, shared=True
+    ):
+        return False
+
+    try:
+        await resolver.resolve(domain, "SOA", tcp=tcp)
+        exists = True
+    except dns.resolver.NXDOMAIN:
+        exists = False
+    except dns.resolver.NoAnswer:
+        exists = True
+
+    cache.set(domain, exists, shared=shared)
+    return exists
+
+
+class AsyncRateLimitedResolver:
+    """Async resolver bound to a single nameserver that sends at most
+    rate queries per second. A rate of 0 means no limit.
+    """
+
+    def __init__(self, nameserver, timeout, rate=0):
+        self.nameserver = nameserver
+        self.resolver = dns.asyncresolver.Resolver(configure=False)
+        self.resolver.nameservers = [nameserver]
+        self.resolver.timeout = timeout
+        self.interval = 1 / rate if rate else 0
+        self.next_time = 0
+
+    async def resolve(self, host, q_type, tcp=False):
+        await self._wait_turn()
+        logger.debug("Resolving '%s' records %s", q_type, host)
+        return await self.resolver.resolve(host, q_type, tcp=tcp)
+
+    async def _wait_turn(self):
+        if not self.interval:
+            return
+
+        now = asyncio.get_running_loop().time()
+        delay = self.next_time - now
+        self.next_time = max(now, self.next_time) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
 def init_log(verbosity=0, log_file=None):
 
     if verbosity == 1:
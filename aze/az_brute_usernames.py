@@ -1,8 +1,8 @@
 #!/usr/bin/env python3
 
-import requests
+from . import http_session
 import argparse
-from concurrent.futures import ThreadPoolExecutor
+from .executor import BoundedExecutor
 from threading import Lock
 from time import sleep
 import logging
@@ -97,7 +97,8 @@ def main():
     domain = args.domain
     
 
-    pool = ThreadPoolExecutor(args.workers)
+    http_session.configure_session(pool_size=args.workers)
+    pool = BoundedExecutor(args.workers)
     print_lock = Lock()
 
     for username in read_in.read_text_targets(args.username):
@@ -152,7 +153,7 @@ def request_getcredentialtype(email):
     headers = {
         'User-Agent': USER_AGENT
     }
-    return requests.post(
+    return http_session.post(
         URL,
         json={"Username": email},
         timeout=TIMEOUT,
@@ -4,7 +4,8 @@ import logging
 from . import read_in
 from . import profile
 from . import tokens
-from . import storage_api
+from . import http_session
+from . import blob_download
 from .error import AzeRequestError
 import sys
 
@@ -26,6 +27,34 @@ def parse_args():
         action="store_true",
     )
 
+    parser.add_argument(
+        "-o", "--output",
+        help="File to write the blob. If none, blob is written to stdout.",
+    )
+
+    parser.add_argument(
+        "-w", "--workers",
+        default=blob_download.DEFAULT_WORKERS,
+        type=int,
+        help="Number of byte ranges downloaded in parallel when output"
+        " file is given. Default: {}".format(blob_download.DEFAULT_WORKERS),
+    )
+
+    parser.add_argument(
+        "--chunk-size",
+        default=blob_download.DEFAULT_CHUNK_SIZE,
+        type=int,
+        help="Size in bytes of the ranges downloaded in parallel."
+        " Default: {}".format(blob_download.DEFAULT_CHUNK_SIZE),
+    )
+
+    parser.add_argument(
+        "--no-resume",
+        action="store_true",
+        help="Start the download from scratch even if a journal of a"
+        " previous interrupted download exists.",
+    )
+
     parser.add_argument(
         "-v", "--verbose",
         action="count",
@@ -52,8 +81,27 @@ def main():
         access_token = None
 
     url = args.url
-    blob_content = storage_api.download_blob(url, access_token)
-    sys.stdout.buffer.write(blob_content)
+    http_session.configure_session(pool_size=args.workers)
+
+    try:
+        if args.output:
+            blob_download.download_blob_to_file(
+                url,
+                args.output,
+                access_token,
+                chunk_size=args.chunk_size,
+                workers=args.workers,
+                resume=not args.no_resume,
+            )
+        else:
+            blob_download.download_blob_to_stream(
+                url, sys.stdout.buffer, access_token
+            )
+    except AzeRequestError as e:
+        logger.error("{}".format(e))
+        return -1
+    finally:
+        http_session.log_stats()
 
 def init_log(verbosity=0, log_file=None):
 
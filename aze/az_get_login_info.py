@@ -1,5 +1,5 @@
 import argparse
-import requests
+from . import http_session
 import json
 import sys
 
@@ -63,24 +63,24 @@ def main():
 
 def get_userrealm_v1(username):
     url = "https://login.microsoftonline.com/common/userrealm/{}?api-version=1.0".format(username)
-    resp = requests.get(url)
+    resp = http_session.get(url)
     return resp.json()
 
 def get_userrealm_v2(username):
     url = "https://login.microsoftonline.com/common/userrealm/{}?api-version=2.0".format(username)
-    resp = requests.get(url)
+    resp = http_session.get(url)
     return resp.json()
 
 def get_getuserrealm(username):
     url = "https://login.microsoftonline.com/GetUserRealm.srf?login={}".format(
         username
     )
-    resp = requests.get(url)
+    resp = http_session.get(url)
     return resp.json()
 
 def get_getcredentialtype(username):
     url = "https://login.microsoftonline.com/common/GetCredentialType"
-    resp = requests.post(url, json={
+    resp = http_session.post(url, json={
         "username": username,
         "isOtherIdpSupported": True,
         "checkPhones": True,
@@ -1,5 +1,5 @@
 import argparse
-import requests
+from . import http_session
 from xml.etree import ElementTree
 from .error import AzeError
 from . import read_in
@@ -53,7 +53,7 @@ def request_tenant_domains(domain):
 </soap:Envelope>
 """.format(domain)
 
-    resp = requests.post(
+    resp = http_session.post(
         "https://autodiscover-s.outlook.com/autodiscover/autodiscover.svc",
         headers=headers,
         data=body.strip(),
@@ -1,9 +1,7 @@
 #!/usr/bin/env python3
 import argparse
-import requests
-import json
-import re
 from . import read_in
+from .tenant import request_tenant_id
 
 def parse_args():
     parser = argparse.ArgumentParser(
@@ -28,12 +26,3 @@ def main():
     except (KeyboardInterrupt, BrokenPipeError):
         pass
 
-
-def request_tenant_id(domain):
-    url = "https://login.microsoftonline.com/{}/.well-known/openid-configuration".format(domain)
-    resp = requests.get(url)
-    if resp.status_code == 200:
-        tenant_id = resp.json()["token_endpoint"][34:70]
-        return tenant_id
-    else:
-        return ""
@@ -1,7 +1,8 @@
 import argparse
 import json
-import base64
 from . import utils
+from . import read_in
+from .tokens import decode_jwts
 
 def parse_args():
     parser = argparse.ArgumentParser(
@@ -9,16 +10,28 @@ def parse_args():
     )
     parser.add_argument(
         "token",
-        help="Access Token to inspect"
+        nargs="*",
+        help="Access Tokens or files with a token per line to inspect."
+        " If none then stdin is used."
+    )
+    parser.add_argument(
+        "-l", "--lines",
+        action="store_true",
+        help="Output a payload per line, instead of indented json.",
     )
     return parser.parse_args()
 
 def main():
     args = parse_args()
-    token = args.token
-    jwt_header, jwt_payload, jwt_signature = token.split(".")
-    jpay = json.loads(base64.b64decode(
-        utils.add_b64_padding(jwt_payload)
-    ).decode())
-    print(json.dumps(jpay, indent=4))
+    indent = None if args.lines else 4
 
+    try:
+        for token, claims, error in decode_jwts(
+                read_in.read_text_targets(args.token)
+        ):
+            if error:
+                utils.eprint("Invalid token {}...: {}".format(token[:20], error))
+                continue
+            print(json.dumps(claims, indent=indent))
+    except (KeyboardInterrupt, BrokenPipeError):
+        pass
@@ -1,9 +1,20 @@
 import argparse
+import logging
+import requests
+from threading import Lock
 from . import graph_api
+from . import http_session
 from . import profile
-from .tokens import search_token_for_subscription
+from . import read_in
+from . import utils
+from .error import AzeError
+from .executor import BoundedExecutor
+from .tokens import TokenProvider
 import json
 
+GRAPH_SCOPES = ["https://graph.microsoft.com//.default"]
+DEFAULT_WORKERS = 4
+
 def parse_args():
     parser = argparse.ArgumentParser(
         "List Administrative Unit members",
@@ -11,7 +22,47 @@ def parse_args():
 
     parser.add_argument(
         "au",
-        help="Administrative unit id",
+        nargs="*",
+        help="Administrative unit id, or files with an id per line. If none"
+        " then stdin is used. With several units, each member is printed"
+        " as a JSON line tagged with its unit.",
+    )
+
+    parser.add_argument(
+        "--select",
+        type=lambda v: v.split(","),
+        help="Comma separated properties to retrieve of each object"
+        " (e.g. id,displayName).",
+    )
+
+    parser.add_argument(
+        "--filter",
+        help="OData filter to only retrieve the matching objects.",
+    )
+
+    parser.add_argument(
+        "--top",
+        type=int,
+        default=graph_api.MAX_PAGE_SIZE,
+        help="Objects retrieved per page. Default: {}".format(
+            graph_api.MAX_PAGE_SIZE
+        ),
+    )
+
+    parser.add_argument(
+        "-w", "--workers",
+        type=int,
+        default=DEFAULT_WORKERS,
+        help="Number of units listed concurrently. Default: {}".format(
+            DEFAULT_WORKERS
+        ),
+    )
+
+    parser.add_argument(
+        "-v", "--verbose",
+        action="count",
+        help="Verbosity",
+        default=0
     )
 
     args = parser.parse_args()
@@ -19,18 +70,63 @@ def parse_args():
 
 def main():
     args = parse_args()
-
-    au = args.au
+    init_log(args.verbose)
 
     default_sub = profile.get_profile_default_subscription()
-    access_token_obj = search_token_for_subscription(
-        default_sub,
-        scopes=["https://graph.microsoft.com//.default"]
-    )
+    token_provider = TokenProvider(default_sub)
 
-    access_token_raw = access_token_obj["secret"]
+    try:
+        if read_in.is_single_target(args.au):
+            for member in graph_api.iter_administrative_unit_members(
+                    token_provider.get_secret(GRAPH_SCOPES),
+                    args.au[0],
+                    **odata_args(args)
+            ):
+                print(json.dumps(member), flush=True)
+            return
 
-    resp = graph_api.list_administrative_unit_members(access_token_raw, au)
+        http_session.configure_session(pool_size=args.workers)
+        print_lock = Lock()
+        with BoundedExecutor(args.workers) as pool:
+            for au in read_in.read_text_targets(args.au):
+                pool.submit(
+                    list_members,
+                    token_provider,
+                    au,
+                    print_lock,
+                    odata_args(args),
+                )
+    except (KeyboardInterrupt, BrokenPipeError):
+        pass
+    finally:
+        http_session.log_stats()
 
-    print(json.dumps(resp, indent=4))
+def odata_args(args):
+    return {"select": args.select, "filter": args.filter, "top": args.top}
 
+def list_members(token_provider, au, print_lock, odata_kwargs):
+    try:
+        for member in graph_api.iter_administrative_unit_members(
+                token_provider.get_secret(GRAPH_SCOPES), au, **odata_kwargs
+        ):
+            with print_lock:
+                utils.print_target_result(au, member)
+    except (AzeError, requests.RequestException, ValueError) as ex:
+        with print_lock:
+            utils.print_target_result(au, error=ex)
+
+
+def init_log(verbosity=0, log_file=None):
+
+    if verbosity == 1:
+        level = logging.INFO
+    elif verbosity > 1:
+        level = logging.DEBUG
+    else:
+        level = logging.WARN
+
+    logging.basicConfig(
+        level=level,
+        filename=log_file,
+        format="%(levelname)s:%(message)s"
+    )
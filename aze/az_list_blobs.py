@@ -5,6 +5,8 @@ from . import read_in
 from . import profile
 from . import tokens
 from . import storage_api
+from . import http_session
+from . import blob_listing
 from .error import AzeRequestError
 
 logger = logging.getLogger("aze")
@@ -26,6 +28,47 @@ def parse_args():
         action="store_true",
     )
 
+    parser.add_argument(
+        "-p", "--prefix",
+        help="Only list blobs whose name starts with prefix.",
+    )
+
+    parser.add_argument(
+        "-d", "--delimiter",
+        help="Group blobs whose name contains the delimiter after the prefix"
+        " into a single record of type prefix, as a virtual directory.",
+    )
+
+    parser.add_argument(
+        "--page-size",
+        type=int,
+        help="Number of results per request, up to 5000.",
+    )
+
+    parser.add_argument(
+        "-i", "--include",
+        nargs="*",
+        choices=storage_api.LIST_INCLUDE_OPTIONS,
+        help="Additional blobs or properties to retrieve.",
+    )
+
+    parser.add_argument(
+        "-f", "--fields",
+        nargs="*",
+        help="Only output these fields of each record (e.g. name"
+        " content_length).",
+    )
+
+    parser.add_argument(
+        "-w", "--workers",
+        default=1,
+        type=int,
+        help="Number of concurrent listings. With more than 1, the virtual"
+        " directories of the container are discovered and listed in"
+        " parallel, and blobs are returned unordered. Ignored with"
+        " --delimiter. Default: 1",
+    )
+
     parser.add_argument(
         "-v", "--verbose",
         action="count",
@@ -51,13 +94,47 @@ def main():
     else:
         access_token = None
 
+    # The parallel listing walks every virtual directory, so it would
+    # return their blobs instead of the prefix records of the delimiter
+    parallel = args.workers > 1
+    if parallel and args.delimiter:
+        logger.warning(
+            "--workers is ignored with --delimiter, listing serially"
+        )
+        parallel = False
+
+    http_session.configure_session(pool_size=args.workers)
+
     for url in read_in.read_text_targets(args.url):
+        if parallel:
+            blobs = blob_listing.list_blobs_parallel(
+                url,
+                access_token,
+                prefix=args.prefix,
+                workers=args.workers,
+                maxresults=args.page_size,
+                include=args.include,
+            )
+        else:
+            blobs = storage_api.list_blobs(
+                url,
+                access_token,
+                prefix=args.prefix,
+                delimiter=args.delimiter,
+                maxresults=args.page_size,
+                include=args.include,
+            )
+
         try:
-            for blob in storage_api.list_blobs(url, access_token):
+            for blob in blobs:
+                if args.fields:
+                    blob = {k: blob[k] for k in args.fields if k in blob}
                 print(json.dumps(blob))
         except AzeRequestError as e:
             logging.warning("{}".format(e))
 
+    http_session.log_stats()
+
 
 def init_log(verbosity=0, log_file=None):
 
@@ -1,6 +1,8 @@
 import argparse
 from . import arm_api
+from . import http_session
 import json
+import logging
 from . import profile
 from .tokens import search_token_for_subscription
 
@@ -8,11 +10,20 @@ def parse_args():
     parser = argparse.ArgumentParser(
         "List roles without requiring a graph access token."
     )
+
+    parser.add_argument(
+        "-v", "--verbose",
+        action="count",
+        help="Verbosity",
+        default=0
+    )
+
     args = parser.parse_args()
     return args
 
 def main():
     args = parse_args()
+    init_log(args.verbose)
 
     default_sub = profile.get_profile_default_subscription()
     access_token_obj = search_token_for_subscription(
@@ -36,6 +47,20 @@ def main():
         role["properties"]["roleProperties"] = role_def_properties
 
     print(json.dumps(roles, indent=4))
+    http_session.log_stats()
 
 
+def init_log(verbosity=0, log_file=None):
 
+    if verbosity == 1:
+        level = logging.INFO
+    elif verbosity > 1:
+        level = logging.DEBUG
+    else:
+        level = logging.WARN
+
+    logging.basicConfig(
+        level=level,
+        filename=log_file,
+        format="%(levelname)s:%(message)s"
+    )
@@ -1,9 +1,13 @@
 import argparse
+import logging
 from . import arm_api
 import json
 from . import profile
+from . import read_in
+from . import utils
 from .tokens import search_token_for_subscription
 from . import arm_api, graph_api
+from . import http_session
 
 def parse_args():
     parser = argparse.ArgumentParser(
@@ -13,11 +17,54 @@ def parse_args():
     ids = parser.add_mutually_exclusive_group(required=True)
 
     ids.add_argument(
-        "--sp-id", help="Service Principal ID"
+        "--sp-id",
+        nargs="+",
+        help="Service Principal ID, or files with an ID per line"
+        " (- for stdin). With several IDs, a JSON line is printed per ID.",
     )
 
     ids.add_argument(
-        "--app-id", help="Application ID"
+        "--app-id",
+        nargs="+",
+        help="Application ID, or files with an ID per line (- for stdin)."
+        " With several IDs, a JSON line is printed per ID.",
+    )
+
+    parser.add_argument(
+        "--select",
+        type=lambda v: v.split(","),
+        help="Comma separated properties to retrieve of each object"
+        " (e.g. id,displayName).",
+    )
+
+    parser.add_argument(
+        "--filter",
+        help="OData filter to only retrieve the matching objects.",
+    )
+
+    parser.add_argument(
+        "--top",
+        type=int,
+        default=graph_api.MAX_PAGE_SIZE,
+        help="Objects retrieved per page. Default: {}".format(
+            graph_api.MAX_PAGE_SIZE
+        ),
+    )
+
+    parser.add_argument(
+        "-w", "--workers",
+        type=int,
+        default=graph_api.DEFAULT_BATCH_WORKERS,
+        help="Number of concurrent batch requests. Default: {}".format(
+            graph_api.DEFAULT_BATCH_WORKERS
+        ),
+    )
+
+    parser.add_argument(
+        "-v", "--verbose",
+        action="count",
+        help="Verbosity",
+        default=0
     )
 
     args = parser.parse_args()
@@ -25,9 +72,10 @@ def parse_args():
 
 def main():
     args = parse_args()
+    init_log(args.verbose)
 
-    sp_id = args.sp_id
-    app_id = args.app_id
+    sp_ids = args.sp_id
+    app_ids = args.app_id
 
     default_sub = profile.get_profile_default_subscription()
     access_token_obj = search_token_for_subscription(
@@ -35,10 +83,49 @@ def main():
         scopes=["https://graph.microsoft.com//.default"]
     )
     access_token_raw = access_token_obj["secret"]
-    roles = graph_api.list_sp_app_role_asignments(
-        access_token_raw,
-        sp_id=sp_id,
-        app_id=app_id,
-    )
 
-    print(json.dumps(roles, indent=4))
+    if read_in.is_single_target(sp_ids or app_ids):
+        roles = graph_api.list_sp_app_role_asignments(
+            access_token_raw,
+            sp_id=sp_ids[0] if sp_ids else None,
+            app_id=app_ids[0] if app_ids else None,
+            select=args.select,
+            filter=args.filter,
+            top=args.top,
+        )
+        print(json.dumps(roles, indent=4))
+        http_session.log_stats()
+        return
+
+    http_session.configure_session(pool_size=args.workers)
+    try:
+        for target, roles, error in graph_api.list_sps_app_role_asignments(
+                access_token_raw,
+                sp_ids=read_in.read_text_targets(sp_ids) if sp_ids else None,
+                app_ids=read_in.read_text_targets(app_ids) if app_ids else None,
+                select=args.select,
+                filter=args.filter,
+                top=args.top,
+                workers=args.workers,
+        ):
+            utils.print_target_result(target, roles, error)
+    except (KeyboardInterrupt, BrokenPipeError):
+        pass
+
+    http_session.log_stats()
+
+
+def init_log(verbosity=0, log_file=None):
+
+    if verbosity == 1:
+        level = logging.INFO
+    elif verbosity > 1:
+        level = logging.DEBUG
+    else:
+        level = logging.WARN
+
+    logging.basicConfig(
+        level=level,
+        filename=log_file,
+        format="%(levelname)s:%(message)s"
+    )
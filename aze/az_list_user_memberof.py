@@ -1,6 +1,10 @@
 import argparse
+import logging
 from . import graph_api
+from . import http_session
 from . import profile
+from . import read_in
+from . import utils
 from .tokens import search_token_for_subscription
 import json
 
@@ -11,7 +15,47 @@ def parse_args():
 
     parser.add_argument(
         "user",
-        help="User principal name or id",
+        nargs="*",
+        help="User principal name or id, or files with a user per line."
+        " If none then stdin is used. With several users, a JSON line is"
+        " printed per user.",
+    )
+
+    parser.add_argument(
+        "--select",
+        type=lambda v: v.split(","),
+        help="Comma separated properties to retrieve of each object"
+        " (e.g. id,displayName).",
+    )
+
+    parser.add_argument(
+        "--filter",
+        help="OData filter to only retrieve the matching objects.",
+    )
+
+    parser.add_argument(
+        "--top",
+        type=int,
+        default=graph_api.MAX_PAGE_SIZE,
+        help="Objects retrieved per page. Default: {}".format(
+            graph_api.MAX_PAGE_SIZE
+        ),
+    )
+
+    parser.add_argument(
+        "-w", "--workers",
+        type=int,
+        default=graph_api.DEFAULT_BATCH_WORKERS,
+        help="Number of concurrent batch requests. Default: {}".format(
+            graph_api.DEFAULT_BATCH_WORKERS
+        ),
+    )
+
+    parser.add_argument(
+        "-v", "--verbose",
+        action="count",
+        help="Verbosity",
+        default=0
     )
 
     args = parser.parse_args()
@@ -19,8 +63,7 @@ def parse_args():
 
 def main():
     args = parse_args()
-
-    user = args.user
+    init_log(args.verbose)
 
     default_sub = profile.get_profile_default_subscription()
     access_token_obj = search_token_for_subscription(
@@ -30,7 +73,46 @@ def main():
 
     access_token_raw = access_token_obj["secret"]
 
-    resp = graph_api.list_user_memberof(access_token_raw, user)
+    if read_in.is_single_target(args.user):
+        resp = graph_api.list_user_memberof(
+            access_token_raw,
+            args.user[0],
+            select=args.select,
+            filter=args.filter,
+            top=args.top,
+        )
+        print(json.dumps(resp, indent=4))
+        http_session.log_stats()
+        return
 
-    print(json.dumps(resp, indent=4))
+    http_session.configure_session(pool_size=args.workers)
+    try:
+        for user, resp, error in graph_api.list_users_memberof(
+                access_token_raw,
+                read_in.read_text_targets(args.user),
+                select=args.select,
+                filter=args.filter,
+                top=args.top,
+                workers=args.workers,
+        ):
+            utils.print_target_result(user, resp, error)
+    except (KeyboardInterrupt, BrokenPipeError):
+        pass
 
+    http_session.log_stats()
+
+
+def init_log(verbosity=0, log_file=None):
+
+    if verbosity == 1:
+        level = logging.INFO
+    elif verbosity > 1:
+        level = logging.DEBUG
+    else:
+        level = logging.WARN
+
+    logging.basicConfig(
+        level=level,
+        filename=log_file,
+        format="%(levelname)s:%(message)s"
+    )
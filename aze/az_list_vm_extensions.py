@@ -1,8 +1,10 @@
 import argparse
 from . import arm_api
+from . import http_session
 from . import profile
 from .tokens import search_token_for_subscription
 import json
+import logging
 
 def parse_args():
     parser = argparse.ArgumentParser(
@@ -19,11 +21,19 @@ def parse_args():
         help="VM name",
     )
 
+    parser.add_argument(
+        "-v", "--verbose",
+        action="count",
+        help="Verbosity",
+        default=0
+    )
+
     args = parser.parse_args()
     return args
 
 def main():
     args = parse_args()
+    init_log(args.verbose)
 
     resource_group_name = args.resource_group
     vm_name = args.vm_name
@@ -44,4 +54,20 @@ def main():
     )
 
     print(json.dumps(resp, indent=4))
+    http_session.log_stats()
+
 
+def init_log(verbosity=0, log_file=None):
+
+    if verbosity == 1:
+        level = logging.INFO
+    elif verbosity > 1:
+        level = logging.DEBUG
+    else:
+        level = logging.WARN
+
+    logging.basicConfig(
+        level=level,
+        filename=log_file,
+        format="%(levelname)s:%(message)s"
+    )
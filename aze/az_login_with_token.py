@@ -1,6 +1,7 @@
 import argparse
 import requests
 import configparser
+import io
 import os
 from . import utils
 from .tenant import resolve_tenant_id
@@ -154,6 +155,7 @@ def set_default_subscription_id(default_subscription_id):
     config.read(config_file)
     config.set(AZURE_CLOUD, "subscription", default_subscription_id)
 
-    with open(config_file, 'w') as fo:
-        config.write(fo)
+    content = io.StringIO()
+    config.write(content)
+    utils.atomic_write(config_file, content.getvalue())
 
@@ -0,0 +1,127 @@
+import argparse
+import logging
+from . import directory_graph
+from . import http_session
+from . import graph_api
+from . import profile
+from . import read_in
+from . import utils
+from .tokens import search_token_for_subscription
+
+logger = logging.getLogger("aze")
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Resolve transitive memberships of groups, Entra ID roles"
+        " and administrative units, from a local copy of the directory"
+        " membership graph.",
+    )
+
+    parser.add_argument(
+        "object",
+        nargs="*",
+        help="Id, display name or user principal name of the objects, or"
+        " files with an object per line. If none then stdin is used.",
+    )
+
+    parser.add_argument(
+        "-r", "--reachers",
+        action="store_true",
+        help="Show the objects that are members of the given groups, roles"
+        " or administrative units, directly or through nested groups."
+        " By default, the groups, roles and administrative units that the"
+        " given objects inherit are shown.",
+    )
+
+    parser.add_argument(
+        "--cache",
+        help="File where the graph is cached. Default:"
+        " ~/.azure/aze_directory_graph_<tenant>.json.gz",
+    )
+
+    parser.add_argument(
+        "--max-age",
+        type=int,
+        default=directory_graph.DEFAULT_MAX_AGE,
+        help="Seconds before the cached graph is retrieved again."
+        " Default: {}".format(directory_graph.DEFAULT_MAX_AGE),
+    )
+
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Retrieve the graph again, even if it is cached.",
+    )
+
+    parser.add_argument(
+        "-w", "--workers",
+        type=int,
+        default=graph_api.DEFAULT_BATCH_WORKERS,
+        help="Number of concurrent batch requests to retrieve the graph."
+        " Default: {}".format(graph_api.DEFAULT_BATCH_WORKERS),
+    )
+
+    parser.add_argument(
+        "-v", "--verbose",
+        action="count",
+        help="Verbosity",
+        default=0
+    )
+
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    init_log(args.verbose)
+
+    default_sub = profile.get_profile_default_subscription()
+    cache_path = args.cache or directory_graph.get_default_cache_path(
+        default_sub["tenantId"]
+    )
+
+    def get_access_token():
+        return search_token_for_subscription(
+            default_sub,
+            scopes=["https://graph.microsoft.com//.default"]
+        )["secret"]
+
+    http_session.configure_session(pool_size=args.workers)
+    graph = directory_graph.load_directory_graph(
+        get_access_token,
+        cache_path,
+        max_age=args.max_age,
+        refresh=args.refresh,
+        workers=args.workers,
+    )
+    logger.info("Directory graph with %d objects", len(graph))
+
+    query = graph.reachers if args.reachers else graph.inherited
+
+    try:
+        for target in read_in.read_text_targets(args.object):
+            try:
+                for record in query(target):
+                    utils.print_target_result(target, record)
+            except KeyError:
+                utils.print_target_result(
+                    target, error="Object not found in directory graph"
+                )
+    except (KeyboardInterrupt, BrokenPipeError):
+        pass
+
+    http_session.log_stats()
+
+def init_log(verbosity=0, log_file=None):
+
+    if verbosity == 1:
+        level = logging.INFO
+    elif verbosity > 1:
+        level = logging.DEBUG
+    else:
+        level = logging.WARN
+
+    logging.basicConfig(
+        level=level,
+        filename=log_file,
+        format="%(levelname)s:%(message)s"
+    )
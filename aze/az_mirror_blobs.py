@@ -0,0 +1,238 @@
+import argparse
+import logging
+import os
+from threading import Lock
+from urllib.parse import quote, urlsplit, urlunsplit
+from . import read_in
+from . import profile
+from . import tokens
+from . import storage_api
+from . import http_session
+from . import blob_download
+from .blob_manifest import BlobManifest, MANIFEST_FILENAME
+from .executor import BoundedExecutor
+from .error import AzeRequestError
+
+logger = logging.getLogger("aze")
+
+DEFAULT_WORKERS = 4
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Download all the blobs of containers into a directory.",
+    )
+
+    parser.add_argument(
+        "url",
+        nargs="*",
+        help="Specify blob container url or files. If None then stdin is used"
+    )
+
+    parser.add_argument(
+        "-o", "--output-dir",
+        default=".",
+        help="Directory to store the blobs, under <account>/<container>/."
+        " Default: current directory",
+    )
+
+    parser.add_argument(
+        "-a", "--auth",
+        help="Use the current login context for the operation.",
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "-w", "--workers",
+        default=DEFAULT_WORKERS,
+        type=int,
+        help="Number of blobs downloaded concurrently."
+        " Default: {}".format(DEFAULT_WORKERS),
+    )
+
+    parser.add_argument(
+        "--bandwidth",
+        default=0,
+        type=int,
+        help="Max bytes per second for all downloads. Default: no limit",
+    )
+
+    parser.add_argument(
+        "--chunk-size",
+        default=blob_download.DEFAULT_CHUNK_SIZE,
+        type=int,
+        help="Blobs bigger than this size in bytes are downloaded by ranges"
+        " that can be resumed. Default: {}".format(
+            blob_download.DEFAULT_CHUNK_SIZE
+        ),
+    )
+
+    parser.add_argument(
+        "-s", "--sync",
+        action="store_true",
+        help="Only download blobs that are new or changed since the last"
+        " sync, according to the manifest.",
+    )
+
+    parser.add_argument(
+        "--manifest",
+        help="SQLite file that records the mirrored blobs for --sync."
+        " Default: {} in output directory".format(MANIFEST_FILENAME),
+    )
+
+    parser.add_argument(
+        "-v", "--verbose",
+        action="count",
+        help="Verbosity",
+        default=0
+    )
+
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    init_log(args.verbose)
+
+    if args.auth:
+        default_sub = profile.get_profile_default_subscription()
+        access_token_obj = tokens.search_token_for_subscription(
+            default_sub,
+            scopes=["https://storage.azure.com/.default"]
+        )
+
+        access_token = access_token_obj["secret"]
+    else:
+        access_token = None
+
+    # The main thread keeps listing the container while the workers
+    # download from the same host, so it needs a connection of its own
+    http_session.configure_session(pool_size=args.workers + 1)
+    limiter = blob_download.BandwidthLimiter(args.bandwidth) \
+        if args.bandwidth else None
+    print_lock = Lock()
+
+    manifest = None
+    if args.sync:
+        os.makedirs(args.output_dir, exist_ok=True)
+        manifest = BlobManifest(
+            args.manifest or os.path.join(args.output_dir, MANIFEST_FILENAME)
+        )
+
+    unchanged = 0
+    try:
+        with BoundedExecutor(args.workers) as pool:
+            for url in read_in.read_text_targets(args.url):
+                for blob_url, path, blob in iter_container_blobs(
+                        url, args.output_dir, access_token
+                ):
+                    if manifest and manifest.is_current(blob_url, blob, path):
+                        unchanged += 1
+                        continue
+
+                    pool.submit(
+                        mirror_blob,
+                        blob_url,
+                        path,
+                        blob,
+                        access_token,
+                        args.chunk_size,
+                        limiter,
+                        print_lock,
+                        manifest,
+                    )
+    except (KeyboardInterrupt, BrokenPipeError):
+        pass
+    finally:
+        if manifest:
+            manifest.close()
+            logger.info("Unchanged blobs skipped: %d", unchanged)
+        http_session.log_stats()
+
+
+def iter_container_blobs(url, output_dir, access_token=None):
+    """Yield the url, local path and listing record of the blobs of the
+    container in url.
+    """
+    container_dir = os.path.join(output_dir, *url_to_path_parts(url))
+    try:
+        for blob in storage_api.list_blobs(url, access_token):
+            if blob["type"] != "blob":
+                continue
+
+            path = blob_local_path(container_dir, blob["name"])
+            if not path:
+                logger.warning("Skipping blob with unsafe name: %s", blob["name"])
+                continue
+
+            yield blob_url(url, blob["name"]), path, blob
+    except AzeRequestError as e:
+        logger.warning("{}".format(e))
+
+
+def mirror_blob(
+        url,
+        path,
+        blob,
+        access_token,
+        chunk_size,
+        limiter,
+        print_lock,
+        manifest=None,
+):
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        blob_download.download_blob_to_file(
+            url,
+            path,
+            access_token,
+            chunk_size=chunk_size,
+            workers=1,
+            properties=blob,
+            limiter=limiter,
+        )
+    except (AzeRequestError, OSError) as e:
+        logger.warning("Unable to download %s: %s", url, e)
+        return
+
+    if manifest:
+        manifest.record(url, blob, path)
+
+    with print_lock:
+        print(path, flush=True)
+
+
+def blob_url(container_url, name):
+    parts = urlsplit(container_url)
+    path = parts.path.rstrip("/") + "/" + quote(name)
+    return urlunsplit(parts._replace(path=path))
+
+
+def url_to_path_parts(url):
+    parts = urlsplit(url)
+    return [parts.netloc] + [p for p in parts.path.split("/") if p]
+
+
+def blob_local_path(container_dir, name):
+    """Return the local path of blob name inside container_dir, or None if
+    the name would escape from the directory.
+    """
+    parts = name.split("/")
+    if any(p in ("", ".", "..") or os.sep in p for p in parts):
+        return None
+    return os.path.join(container_dir, *parts)
+
+
+def init_log(verbosity=0, log_file=None):
+
+    if verbosity == 1:
+        level = logging.INFO
+    elif verbosity > 2:
+        level = logging.DEBUG
+    else:
+        level = logging.WARN
+
+    logging.basicConfig(
+        level=level,
+        filename=log_file,
+        format="%(levelname)s:%(name)s:%(message)s"
+    )
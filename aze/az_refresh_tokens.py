@@ -0,0 +1,109 @@
+import argparse
+import logging
+from . import profile
+from .token_broker import TokenRefreshBroker, DEFAULT_MARGIN, \
+    DEFAULT_INTERVAL
+
+logger = logging.getLogger("aze")
+
+DEFAULT_SCOPES = [
+    "https://management.core.windows.net//.default",
+    "https://graph.microsoft.com//.default",
+]
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Keep the access tokens of the token cache refreshed"
+        " before they expire, so commands always find a valid token.",
+    )
+
+    parser.add_argument(
+        "-s", "--scope",
+        action="append",
+        help="Scope of the tokens to keep refreshed. Can be specified several"
+        " times. Default: {}".format(", ".join(DEFAULT_SCOPES)),
+    )
+
+    parser.add_argument(
+        "--all-subscriptions",
+        action="store_true",
+        help="Refresh the tokens of the accounts of all the subscriptions"
+        " of the profile, not only the default.",
+    )
+
+    parser.add_argument(
+        "--margin",
+        type=int,
+        default=DEFAULT_MARGIN,
+        help="Refresh tokens that expire in less than these seconds."
+        " Default: {}".format(DEFAULT_MARGIN),
+    )
+
+    parser.add_argument(
+        "--interval",
+        type=int,
+        default=DEFAULT_INTERVAL,
+        help="Seconds between checks. Default: {}".format(DEFAULT_INTERVAL),
+    )
+
+    parser.add_argument(
+        "--once",
+        action="store_true",
+        help="Refresh the expiring tokens once and exit.",
+    )
+
+    parser.add_argument(
+        "-v", "--verbose",
+        action="count",
+        help="Verbosity",
+        default=0
+    )
+
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    init_log(args.verbose)
+
+    if args.all_subscriptions:
+        subscriptions = unique_accounts(profile.get_profile_subscriptions())
+    else:
+        subscriptions = [profile.get_profile_default_subscription()]
+
+    broker = TokenRefreshBroker(margin=args.margin, interval=args.interval)
+    for subscription in subscriptions:
+        for scope in args.scope or DEFAULT_SCOPES:
+            broker.track(subscription, [scope])
+
+    try:
+        if args.once:
+            broker.refresh_due()
+        else:
+            broker.run()
+    except KeyboardInterrupt:
+        pass
+
+def unique_accounts(subscriptions):
+    """Keep a subscription per user and tenant, since tokens belong to
+    accounts and not to subscriptions.
+    """
+    accounts = {}
+    for sub in subscriptions:
+        key = (sub["user"]["name"], sub["tenantId"])
+        accounts.setdefault(key, sub)
+    return list(accounts.values())
+
+def init_log(verbosity=0, log_file=None):
+
+    if verbosity == 1:
+        level = logging.INFO
+    elif verbosity > 1:
+        level = logging.DEBUG
+    else:
+        level = logging.WARN
+
+    logging.basicConfig(
+        level=level,
+        filename=log_file,
+        format="%(levelname)s:%(message)s"
+    )
@@ -1,5 +1,5 @@
 import argparse
-from .tokens import search_token_in_cache, CredentialType
+from .tokens import search_token_in_cache, CredentialType, Jwt
 import json
 
 def parse_args():
@@ -23,6 +23,12 @@ def parse_args():
         action="append",
     )
 
+    parser.add_argument(
+        "-d", "--decode",
+        help="Add the decoded claims of access and ID tokens",
+        action="store_true",
+    )
+
     type_group = parser.add_mutually_exclusive_group()
     type_group.add_argument(
         "-a", "--access", "--access-token",
@@ -89,4 +95,8 @@ def main():
             query=query,
             scopes=scopes,
     ):
+        if args.decode and token_type in (
+                CredentialType.ACCESS_TOKEN, CredentialType.ID_TOKEN
+        ):
+            entry = dict(entry, claims=Jwt(entry["secret"]).claims)
         print(json.dumps(entry))
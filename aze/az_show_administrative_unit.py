@@ -1,6 +1,10 @@
 import argparse
+import logging
 from . import graph_api
+from . import http_session
 from . import profile
+from . import read_in
+from . import utils
 from .tokens import search_token_for_subscription
 import json
 
@@ -11,7 +15,33 @@ def parse_args():
 
     parser.add_argument(
         "au",
-        help="Administrative unit id",
+        nargs="*",
+        help="Administrative unit id, or files with an id per line. If none"
+        " then stdin is used. With several units, a JSON line is printed"
+        " per unit.",
+    )
+
+    parser.add_argument(
+        "--select",
+        type=lambda v: v.split(","),
+        help="Comma separated properties to retrieve of each object"
+        " (e.g. id,displayName).",
+    )
+
+    parser.add_argument(
+        "-w", "--workers",
+        type=int,
+        default=graph_api.DEFAULT_BATCH_WORKERS,
+        help="Number of concurrent batch requests. Default: {}".format(
+            graph_api.DEFAULT_BATCH_WORKERS
+        ),
+    )
+
+    parser.add_argument(
+        "-v", "--verbose",
+        action="count",
+        help="Verbosity",
+        default=0
     )
 
     args = parser.parse_args()
@@ -19,8 +49,7 @@ def parse_args():
 
 def main():
     args = parse_args()
-
-    au = args.au
+    init_log(args.verbose)
 
     default_sub = profile.get_profile_default_subscription()
     access_token_obj = search_token_for_subscription(
@@ -30,7 +59,40 @@ def main():
 
     access_token_raw = access_token_obj["secret"]
 
-    resp = graph_api.show_administrative_unit(access_token_raw, au)
+    if read_in.is_single_target(args.au):
+        resp = graph_api.show_administrative_unit(
+            access_token_raw, args.au[0], select=args.select
+        )
+        print(json.dumps(resp, indent=4))
+        http_session.log_stats()
+        return
+
+    http_session.configure_session(pool_size=args.workers)
+    try:
+        for au, resp, error in graph_api.show_administrative_units(
+                access_token_raw,
+                read_in.read_text_targets(args.au),
+                select=args.select,
+                workers=args.workers,
+        ):
+            utils.print_target_result(au, resp, error)
+    except (KeyboardInterrupt, BrokenPipeError):
+        pass
+
+    http_session.log_stats()
 
-    print(json.dumps(resp, indent=4))
 
+def init_log(verbosity=0, log_file=None):
+
+    if verbosity == 1:
+        level = logging.INFO
+    elif verbosity > 1:
+        level = logging.DEBUG
+    else:
+        level = logging.WARN
+
+    logging.basicConfig(
+        level=level,
+        filename=log_file,
+        format="%(levelname)s:%(message)s"
+    )
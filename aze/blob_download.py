@@ -0,0 +1,275 @@
+import json
+import logging
+import os
+import threading
+import time
+from . import storage_api
+from .executor import BoundedExecutor
+
+logger = logging.getLogger("aze")
+
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+DEFAULT_WORKERS = 4
+STREAM_BUFFER_SIZE = 256 * 1024
+JOURNAL_SUFFIX = ".azejournal"
+
+
+def download_blob_to_stream(url, fo, access_token=None, limiter=None):
+    """Write the blob in the file object fo as it is received, without
+    keeping it in memory.
+    """
+    resp = storage_api.request_blob(url, access_token, stream=True)
+    with resp:
+        write_response(resp, fo, limiter)
+
+def write_response(resp, fo, limiter=None):
+    for data in resp.iter_content(STREAM_BUFFER_SIZE):
+        if limiter:
+            limiter.consume(len(data))
+        fo.write(data)
+
+
+def download_blob_to_file(
+        url,
+        path,
+        access_token=None,
+        chunk_size=DEFAULT_CHUNK_SIZE,
+        workers=DEFAULT_WORKERS,
+        resume=True,
+        properties=None,
+        limiter=None,
+):
+    """Download the blob into path. Blobs bigger than chunk_size are
+    retrieved in byte ranges of chunk_size, requested in parallel by
+    workers threads, and written in their offset of the preallocated
+    output file.
+
+    The completed ranges are recorded in a journal next to path. If
+    resume is True and a journal of a previous download of the same blob
+    version exists, only the missing ranges are requested.
+
+    properties are the blob content_length, etag and last_modified, as
+    returned by a blob listing. If not given they are requested.
+    """
+    properties = properties \
+        or storage_api.get_blob_properties(url, access_token)
+    size = properties["content_length"]
+
+    if size <= chunk_size:
+        with open(path, "wb") as fo:
+            download_blob_to_stream(url, fo, access_token, limiter)
+        return
+
+    journal_path = path + JOURNAL_SUFFIX
+    journal = None
+    if resume:
+        journal = DownloadJournal.load(journal_path)
+        if journal and not journal.can_resume(path, properties, chunk_size):
+            logger.info("Blob changed since last download, restarting")
+            journal = None
+
+    if journal:
+        logger.info(
+            "Resuming download, %d bytes already downloaded",
+            journal.downloaded_bytes(),
+        )
+    else:
+        journal = DownloadJournal(journal_path, url, properties, chunk_size)
+        with open(path, "wb") as fo:
+            fo.truncate(size)
+        journal.save()
+
+    download_ranges(
+        url,
+        path,
+        journal.pending_ranges(),
+        access_token=access_token,
+        etag=properties["etag"],
+        workers=workers,
+        on_range_done=journal.mark_done,
+        limiter=limiter,
+    )
+    journal.remove()
+
+
+def download_ranges(
+        url,
+        path,
+        ranges,
+        access_token=None,
+        etag=None,
+        workers=DEFAULT_WORKERS,
+        on_range_done=None,
+        limiter=None,
+):
+    """Download the byte ranges of the blob into their offsets of path,
+    that must exist. on_range_done is called from the worker threads
+    with each range once it is written.
+    """
+    with BoundedExecutor(workers) as pool:
+        futures = [
+            pool.submit(
+                download_range,
+                url,
+                path,
+                byte_range,
+                access_token,
+                etag,
+                on_range_done,
+                limiter,
+            )
+            for byte_range in ranges
+        ]
+
+    for future in futures:
+        future.result()
+
+
+def download_range(
+        url,
+        path,
+        byte_range,
+        access_token=None,
+        etag=None,
+        on_range_done=None,
+        limiter=None,
+):
+    logger.debug("Downloading bytes %d-%d of %s", *byte_range, url)
+    resp = storage_api.request_blob(
+        url,
+        access_token,
+        byte_range=byte_range,
+        if_match=etag,
+        stream=True,
+    )
+    with resp, open(path, "r+b") as fo:
+        fo.seek(byte_range[0])
+        write_response(resp, fo, limiter)
+
+    if on_range_done:
+        on_range_done(byte_range)
+
+
+def split_ranges(size, chunk_size):
+    return [
+        (start, min(start + chunk_size, size) - 1)
+        for start in range(0, size, chunk_size)
+    ]
+
+
+class DownloadJournal:
+    """Record of the byte ranges of a blob already written in the output
+    file, identified by the blob ETag and Last-Modified, to resume an
+    interrupted download.
+    """
+
+    def __init__(self, path, url, properties, chunk_size, done=None):
+        self.path = path
+        self.url = url
+        self.properties = {
+            "content_length": properties["content_length"],
+            "etag": storage_api.normalize_etag(properties["etag"]),
+            "last_modified": properties["last_modified"],
+        }
+        self.chunk_size = chunk_size
+        self.done = set(done or [])
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path):
+        try:
+            with open(path) as fi:
+                data = json.load(fi)
+            return cls(
+                path,
+                data["url"],
+                data["properties"],
+                data["chunk_size"],
+                done=data["done"],
+            )
+        except FileNotFoundError:
+            return None
+        except (ValueError, KeyError, TypeError) as ex:
+            logger.warning("Ignoring invalid journal %s: %s", path, ex)
+            return None
+
+    def can_resume(self, output_path, properties, chunk_size):
+        try:
+            output_size = os.path.getsize(output_path)
+        except OSError:
+            return False
+
+        return chunk_size == self.chunk_size \
+            and output_size == properties["content_length"] \
+            and self.properties["content_length"] \
+                == properties["content_length"] \
+            and self.properties["etag"] \
+                == storage_api.normalize_etag(properties["etag"]) \
+            and self.properties["last_modified"] \
+                == properties["last_modified"]
+
+    def pending_ranges(self):
+        return [
+            byte_range
+            for byte_range in split_ranges(
+                self.properties["content_length"], self.chunk_size
+            )
+            if byte_range[0] not in self.done
+        ]
+
+    def downloaded_bytes(self):
+        size = self.properties["content_length"]
+        return sum(
+            min(start + self.chunk_size, size) - start
+            for start in self.done
+        )
+
+    def mark_done(self, byte_range):
+        with self._lock:
+            self.done.add(byte_range[0])
+            self.save()
+
+    def save(self):
+        data = {
+            "url": self.url,
+            "properties": self.properties,
+            "chunk_size": self.chunk_size,
+            "done": sorted(self.done),
+        }
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as fo:
+            json.dump(data, fo)
+        os.replace(tmp_path, self.path)
+
+    def remove(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class BandwidthLimiter:
+    """Token bucket shared by several downloads to keep their combined
+    throughput under rate bytes per second.
+    """
+
+    def __init__(self, rate):
+        self.rate = rate
+        self._available = rate
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, size):
+        with self._lock:
+            now = time.monotonic()
+            self._available = min(
+                self.rate,
+                self._available + (now - self._last) * self.rate
+            )
+            self._last = now
+            self._available -= size
+            delay = -self._available / self.rate \
+                if self._available < 0 else 0
+
+        if delay:
+            time.sleep(delay)
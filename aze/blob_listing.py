@@ -0,0 +1,97 @@
+import queue
+import threading
+from . import storage_api
+
+DEFAULT_WORKERS = 4
+RESULTS_BUFFER_SIZE = 10000
+
+_DONE = object()
+
+
+def list_blobs_parallel(
+        url,
+        access_token=None,
+        prefix=None,
+        delimiter="/",
+        workers=DEFAULT_WORKERS,
+        maxresults=None,
+        include=None,
+):
+    """List all the blobs of a container by walking its virtual directory
+    tree, listing disjoint prefixes concurrently. Each listing uses the
+    delimiter to discover the subprefixes, that are queued to be listed by
+    the next free worker, so no more than workers requests are in flight.
+    Blobs are yielded unordered, as they are received.
+    """
+    results = queue.Queue(maxsize=RESULTS_BUFFER_SIZE)
+    prefixes = queue.Queue()
+    stop = threading.Event()
+    state = {"pending": 1}
+    state_lock = threading.Lock()
+
+    def put_result(item):
+        # Give up if the consumer stopped, instead of blocking forever
+        while not stop.is_set():
+            try:
+                results.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def list_prefix(current_prefix):
+        for record in storage_api.list_blobs(
+                url,
+                access_token,
+                prefix=current_prefix,
+                delimiter=delimiter,
+                maxresults=maxresults,
+                include=include,
+        ):
+            if stop.is_set():
+                return
+
+            if record["type"] == "prefix":
+                with state_lock:
+                    state["pending"] += 1
+                prefixes.put(record["name"])
+            elif not put_result(record):
+                return
+
+    def worker():
+        while True:
+            current_prefix = prefixes.get()
+            if current_prefix is None:
+                return
+
+            try:
+                list_prefix(current_prefix)
+            except Exception as ex:
+                put_result(ex)
+            finally:
+                with state_lock:
+                    state["pending"] -= 1
+                    done = state["pending"] == 0
+                if done:
+                    put_result(_DONE)
+
+    threads = [
+        threading.Thread(target=worker, daemon=True)
+        for _ in range(max(workers, 1))
+    ]
+    prefixes.put(prefix or "")
+    for thread in threads:
+        thread.start()
+
+    try:
+        while True:
+            item = results.get()
+            if item is _DONE:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        for _ in threads:
+            prefixes.put(None)
@@ -0,0 +1,95 @@
+import os
+import sqlite3
+import threading
+import time
+from urllib.parse import urlsplit, urlunsplit
+
+MANIFEST_FILENAME = ".aze-manifest.sqlite"
+
+
+class BlobManifest:
+    """SQLite record of the blobs already mirrored, with the properties
+    they had in the listing, to only download new or changed blobs.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS blobs ("
+            " url TEXT PRIMARY KEY,"
+            " path TEXT NOT NULL,"
+            " etag TEXT,"
+            " last_modified TEXT,"
+            " content_length INTEGER,"
+            " content_md5 TEXT,"
+            " synced_at REAL"
+            ")"
+        )
+        self._conn.commit()
+
+    def is_current(self, url, blob, path):
+        """Check if the blob was already mirrored in path with the same
+        ETag, Last-Modified and size than in the listing.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT path, etag, last_modified, content_length"
+                " FROM blobs WHERE url = ?",
+                (manifest_key(url),)
+            ).fetchone()
+
+        if row is None:
+            return False
+
+        if row != (
+                path,
+                blob["etag"],
+                blob["last_modified"],
+                blob["content_length"],
+        ):
+            return False
+
+        try:
+            return os.path.getsize(path) == blob["content_length"]
+        except OSError:
+            return False
+
+    def record(self, url, blob, path):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO blobs"
+                " (url, path, etag, last_modified, content_length,"
+                " content_md5, synced_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    manifest_key(url),
+                    path,
+                    blob["etag"],
+                    blob["last_modified"],
+                    blob["content_length"],
+                    blob["content_md5"],
+                    time.time(),
+                )
+            )
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
+
+
+def manifest_key(url):
+    """Blob url without query, since SAS tokens change between runs."""
+    parts = urlsplit(url)
+    return urlunsplit(parts._replace(query="", fragment=""))
@@ -0,0 +1,284 @@
+import gzip
+import json
+import logging
+import os
+import time
+from array import array
+from collections import deque
+from . import graph_api
+from . import utils
+
+logger = logging.getLogger("aze")
+
+CACHE_VERSION = 1
+DEFAULT_MAX_AGE = 24 * 60 * 60
+
+MEMBER_PROPERTIES = ["id", "displayName", "userPrincipalName"]
+
+
+class DirectoryGraph:
+    """Membership graph of the directory objects. Object IDs are interned
+    to integers, and the members of each container (group, directory role
+    or administrative unit) and the containers of each member are kept as
+    arrays of those integers, so big directories fit in memory and the
+    transitive queries only walk integers.
+    """
+
+    def __init__(self):
+        self.created_at = time.time()
+        self._ids = []
+        self._names = []
+        self._types = array("B")
+        self._type_names = []
+        self._index = {}
+        self._members = []
+        self._memberof = []
+        self._by_name = None
+
+    def __len__(self):
+        return len(self._ids)
+
+    def intern(self, object_id, object_type=None, name=None):
+        """Return the integer of the object, adding it if new."""
+        node = self._index.get(object_id)
+        if node is None:
+            node = len(self._ids)
+            self._index[object_id] = node
+            self._ids.append(object_id)
+            self._names.append(name)
+            self._types.append(self._intern_type(object_type))
+            self._members.append(array("l"))
+            self._memberof.append(array("l"))
+            self._by_name = None
+        else:
+            if name and not self._names[node]:
+                self._names[node] = name
+            if object_type and not self._type_names[self._types[node]]:
+                self._types[node] = self._intern_type(object_type)
+        return node
+
+    def _intern_type(self, object_type):
+        try:
+            return self._type_names.index(object_type)
+        except ValueError:
+            self._type_names.append(object_type)
+            return len(self._type_names) - 1
+
+    def add_member(self, container_id, member_id):
+        container = self.intern(container_id)
+        member = self.intern(member_id)
+        self._members[container].append(member)
+        self._memberof[member].append(container)
+
+    def add_object(self, obj):
+        """Intern a Graph directory object."""
+        return self.intern(
+            obj["id"],
+            object_type_from_odata(obj.get("@odata.type")),
+            obj.get("userPrincipalName") or obj.get("displayName"),
+        )
+
+    def find(self, value):
+        """Return the integer of the object with the id, display name or
+        user principal name, or None if not in the graph.
+        """
+        node = self._index.get(value)
+        if node is not None:
+            return node
+
+        if self._by_name is None:
+            self._by_name = {}
+            for node, name in enumerate(self._names):
+                if name:
+                    self._by_name.setdefault(name.lower(), node)
+        return self._by_name.get(value.lower())
+
+    def describe(self, node):
+        return {
+            "id": self._ids[node],
+            "type": self._type_names[self._types[node]],
+            "name": self._names[node],
+        }
+
+    def inherited(self, value):
+        """Yield the groups, roles and administrative units that the object
+        belongs to, directly or through nested groups, with the depth of
+        the membership.
+        """
+        return self._walk(value, self._memberof)
+
+    def reachers(self, value):
+        """Yield the objects that are members of the container, directly or
+        through nested groups, with the depth of the membership.
+        """
+        return self._walk(value, self._members)
+
+    def _walk(self, value, adjacency):
+        start = self.find(value)
+        if start is None:
+            raise KeyError(value)
+
+        seen = {start}
+        pending = deque([(start, 0)])
+        while pending:
+            node, depth = pending.popleft()
+            for neighbor in adjacency[node]:
+                if neighbor in seen:
+                    continue
+                seen.add(neighbor)
+                pending.append((neighbor, depth + 1))
+                record = self.describe(neighbor)
+                record["depth"] = depth + 1
+                yield record
+
+    def save(self, path):
+        data = {
+            "version": CACHE_VERSION,
+            "created_at": self.created_at,
+            "ids": self._ids,
+            "names": self._names,
+            "types": list(self._types),
+            "type_names": self._type_names,
+            "members": [
+                [container] + list(members)
+                for container, members in enumerate(self._members)
+                if members
+            ],
+        }
+        content = json.dumps(data, separators=(",", ":")).encode()
+        tmp_path = path + ".tmp"
+        with gzip.open(tmp_path, "wb") as fo:
+            fo.write(content)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with gzip.open(path, "rb") as fi:
+            data = json.loads(fi.read())
+
+        if data.get("version") != CACHE_VERSION:
+            raise ValueError("Unsupported cache version")
+
+        graph = cls()
+        graph.created_at = data["created_at"]
+        graph._ids = data["ids"]
+        graph._names = data["names"]
+        graph._types = array("B", data["types"])
+        graph._type_names = data["type_names"]
+        graph._index = {
+            object_id: node for node, object_id in enumerate(graph._ids)
+        }
+        graph._members = [array("l") for _ in graph._ids]
+        graph._memberof = [array("l") for _ in graph._ids]
+        for container, *members in data["members"]:
+            graph._members[container].extend(members)
+            for member in members:
+                graph._memberof[member].append(container)
+        return graph
+
+
+def object_type_from_odata(odata_type):
+    """Return group from #microsoft.graph.group."""
+    if not odata_type:
+        return None
+    return odata_type.rsplit(".", 1)[-1]
+
+
+def fetch_directory_graph(access_token, workers=graph_api.DEFAULT_BATCH_WORKERS):
+    """Retrieve the groups, directory roles and administrative units of the
+    directory and their members, requesting the members in $batch
+    requests.
+    """
+    graph = DirectoryGraph()
+    sources = [
+        (
+            "group",
+            graph_api.iter_groups(
+                access_token,
+                select=["id", "displayName"],
+                top=graph_api.MAX_PAGE_SIZE,
+            ),
+            graph_api.list_groups_members,
+        ),
+        (
+            "directoryRole",
+            graph_api.iter_directory_roles(
+                access_token,
+                select=["id", "displayName"],
+            ),
+            graph_api.list_directory_roles_members,
+        ),
+        (
+            "administrativeUnit",
+            graph_api.iter_administrative_units(
+                access_token,
+                select=["id", "displayName"],
+                top=graph_api.MAX_PAGE_SIZE,
+            ),
+            graph_api.list_administrative_units_members,
+        ),
+    ]
+
+    for object_type, containers, list_members in sources:
+        ids = []
+        for container in containers:
+            graph.intern(container["id"], object_type, container["displayName"])
+            ids.append(container["id"])
+
+        logger.info("Retrieving members of %d %ss", len(ids), object_type)
+        for container_id, members, error in list_members(
+                access_token,
+                ids,
+                select=MEMBER_PROPERTIES,
+                workers=workers,
+        ):
+            if error:
+                logger.warning(
+                    "Unable to list members of %s: %s", container_id, error
+                )
+                continue
+            for member in members:
+                graph.add_object(member)
+                graph.add_member(container_id, member["id"])
+
+    return graph
+
+
+def get_default_cache_path(tenant_id):
+    return os.path.join(
+        os.environ["HOME"],
+        ".azure",
+        "aze_directory_graph_{}.json.gz".format(tenant_id),
+    )
+
+
+def load_directory_graph(
+        get_access_token,
+        cache_path,
+        max_age=DEFAULT_MAX_AGE,
+        refresh=False,
+        workers=graph_api.DEFAULT_BATCH_WORKERS,
+):
+    """Return the directory graph from the cache if it is younger than
+    max_age seconds, otherwise retrieve it and update the cache.
+    get_access_token is only called to retrieve the graph, so a cached
+    graph is used without network traffic.
+    """
+    if not refresh:
+        try:
+            graph = DirectoryGraph.load(cache_path)
+            if time.time() - graph.created_at <= max_age:
+                return graph
+        except FileNotFoundError:
+            pass
+        except (ValueError, KeyError, OSError) as ex:
+            logger.warning(
+                "Unable to load directory graph %s: %s", cache_path, ex
+            )
+
+    graph = fetch_directory_graph(get_access_token(), workers=workers)
+    try:
+        graph.save(cache_path)
+    except OSError as ex:
+        utils.eprint("Unable to save directory graph: {}".format(ex))
+    return graph
@@ -0,0 +1,143 @@
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger("aze")
+
+DEFAULT_TTL = 24 * 60 * 60
+
+
+class DnsResolutionCache:
+    """Remembers if domains exist and which zones are wildcards.
+
+    When a path is given, every result is kept and persisted in that
+    file, so later runs skip domains already resolved until their ttl
+    expires. Otherwise only shared results (parent names and wildcard
+    zones) are kept in memory, so the cache doesn't grow with the
+    number of candidates.
+    """
+
+    def __init__(self, path=None, ttl=DEFAULT_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._domains = {}
+        self._wildcards = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+
+        if path:
+            self.load()
+
+    def get(self, domain, zone):
+        """Return True or False if the existence of domain is known or
+        implied by a parent name under zone that doesn't exist. None if
+        unknown.
+        """
+        now = time.time()
+        with self._lock:
+            exists = self._get_entry(self._domains, domain, now)
+            if exists is not None:
+                self.hits += 1
+                return exists
+
+            for parent in iter_parent_domains(domain, zone):
+                if self._get_entry(self._domains, parent, now) is False:
+                    self.hits += 1
+                    return False
+
+        return None
+
+    def set(self, domain, exists, shared=False):
+        if not (shared or self.path):
+            return
+        with self._lock:
+            self._domains[domain] = (exists, time.time() + self.ttl)
+
+    def get_wildcard(self, zone):
+        with self._lock:
+            return self._get_entry(self._wildcards, zone, time.time())
+
+    def set_wildcard(self, zone, is_wildcard):
+        with self._lock:
+            self._wildcards[zone] = (is_wildcard, time.time() + self.ttl)
+
+    @staticmethod
+    def _get_entry(entries, key, now):
+        try:
+            value, expires_at = entries[key]
+        except KeyError:
+            return None
+
+        if expires_at < now:
+            del entries[key]
+            return None
+        return value
+
+    def load(self):
+        try:
+            with open(self.path) as fi:
+                data = json.load(fi)
+        except FileNotFoundError:
+            return
+        except (ValueError, OSError) as ex:
+            logger.warning(
+                "Unable to load DNS cache %s: %s", self.path, ex
+            )
+            return
+
+        now = time.time()
+        for key, entries in (
+                ("domains", self._domains),
+                ("wildcards", self._wildcards),
+        ):
+            for name, (value, expires_at) in data.get(key, {}).items():
+                if expires_at >= now:
+                    entries[name] = (value, expires_at)
+
+    def save(self):
+        if not self.path:
+            return
+
+        now = time.time()
+        with self._lock:
+            data = {
+                key: {
+                    name: entry
+                    for name, entry in entries.items()
+                    if entry[1] >= now
+                }
+                for key, entries in (
+                        ("domains", self._domains),
+                        ("wildcards", self._wildcards),
+                )
+            }
+
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as fo:
+            json.dump(data, fo)
+        os.replace(tmp_path, self.path)
+
+
+def iter_parent_domains(domain, zone):
+    """Yield the names between domain and zone, from the closest to zone.
+    For a.b.zone.com and zone.com yields b.zone.com.
+    """
+    suffix = "." + zone
+    if not domain.endswith(suffix):
+        return
+
+    labels = domain[:-len(suffix)].split(".")
+    for i in range(len(labels) - 1, 0, -1):
+        yield ".".join(labels[i:]) + suffix
+
+
+def parent_domain(domain, zone):
+    """Return the parent name of domain under zone, or None if the
+    parent is the zone itself.
+    """
+    parent = domain.split(".", 1)[1] if "." in domain else ""
+    if parent == zone or not parent.endswith("." + zone):
+        return None
+    return parent
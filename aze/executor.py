@@ -0,0 +1,40 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class BoundedExecutor:
+    """Thread pool whose submit blocks while max_pending tasks are queued
+    or running. This way a producer that iterates a huge candidates
+    generator only advances when workers get free, instead of filling the
+    unbounded queue of ThreadPoolExecutor with pending futures.
+    """
+
+    def __init__(self, workers, max_pending=None):
+        self._pool = ThreadPoolExecutor(workers)
+        self._slots = threading.BoundedSemaphore(
+            max_pending or workers * 2
+        )
+
+    def submit(self, fn, *args, **kwargs):
+        self._slots.acquire()
+        try:
+            future = self._pool.submit(fn, *args, **kwargs)
+        except BaseException:
+            self._slots.release()
+            raise
+
+        future.add_done_callback(self._release_slot)
+        return future
+
+    def _release_slot(self, future):
+        self._slots.release()
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        self._pool.shutdown(wait=wait, cancel_futures=cancel_futures)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown(wait=True)
+        return False
@@ -1,4 +1,23 @@
-from .request_az import request_az_api, request_az_api_values_until_no_more
+import time
+from collections import deque
+from itertools import islice
+from urllib.parse import urlencode, quote
+from requests.structures import CaseInsensitiveDict
+from .request_az import request_az_api, request_az_api_values_until_no_more,\
+    iter_az_api_values
+from .executor import BoundedExecutor
+from .error import AzeRequestError
+from .retry import DEFAULT_RETRY_POLICY
+
+GRAPH_URL = "https://graph.microsoft.com/v1.0"
+GRAPH_BATCH_URL = "https://graph.microsoft.com/v1.0/$batch"
+
+# Max number of requests allowed by Graph in a $batch request
+MAX_BATCH_REQUESTS = 20
+DEFAULT_BATCH_WORKERS = 4
+
+# Max $top allowed by most of the Graph list operations
+MAX_PAGE_SIZE = 999
 
 
 def add_secret_to_application(access_token, app_id):
@@ -13,13 +32,26 @@ def add_secret_to_application(access_token, app_id):
         },
     )
 
-def list_applications(access_token):
-    return request_az_api(
+def list_applications(access_token, select=None, filter=None, top=None):
+    return list(iter_applications(
+        access_token, select=select, filter=filter, top=top
+    ))
+
+def iter_applications(access_token, select=None, filter=None, top=None):
+    return iter_az_api_values(
         "https://graph.microsoft.com/v1.0/applications",
         access_token,
-    )["value"]
+        params=odata_params(select, filter, top),
+    )
 
-def list_sp_app_role_asignments(access_token, sp_id=None, app_id=None):
+def list_sp_app_role_asignments(
+        access_token,
+        sp_id=None,
+        app_id=None,
+        select=None,
+        filter=None,
+        top=None,
+):
     if sp_id:
         url = "https://graph.microsoft.com/v1.0/servicePrincipals/{}/appRoleAssignments".format(sp_id)
     elif app_id:
@@ -28,37 +60,348 @@ def list_sp_app_role_asignments(access_token, sp_id=None, app_id=None):
     else:
         raise ValueError("Must provide sp_id or app_id")
 
-    return request_az_api(
+    return request_az_api_values_until_no_more(
         url,
         access_token,
-    )["value"]
+        params=odata_params(select, filter, top),
+    )
 
-def list_user_memberof(access_token, user):
-    return request_az_api(
+def list_user_memberof(access_token, user, select=None, filter=None, top=None):
+    return list(iter_user_memberof(
+        access_token, user, select=select, filter=filter, top=top
+    ))
+
+def iter_user_memberof(access_token, user, select=None, filter=None, top=None):
+    return iter_az_api_values(
         "https://graph.microsoft.com/v1.0/users/{}/memberOf".format(user),
         access_token,
-    )["value"]
+        params=odata_params(select, filter, top),
+    )
 
-def show_ad_role(access_token, role_id):
+def show_ad_role(access_token, role_id, select=None):
     return request_az_api(
         "https://graph.microsoft.com/v1.0/directoryRoles/{}".format(role_id),
         access_token,
+        params=odata_params(select),
     )
 
-def show_administrative_unit(access_token, au):
+def show_administrative_unit(access_token, au, select=None):
     return request_az_api(
         "https://graph.microsoft.com/v1.0/directory/administrativeUnits/{}".format(au),
         access_token,
+        params=odata_params(select),
     )
 
-def list_administrative_unit_members(access_token, au):
-    return request_az_api_values_until_no_more(
+def list_administrative_unit_members(
+        access_token, au, select=None, filter=None, top=None
+):
+    return list(iter_administrative_unit_members(
+        access_token, au, select=select, filter=filter, top=top
+    ))
+
+def iter_administrative_unit_members(
+        access_token, au, select=None, filter=None, top=None
+):
+    return iter_az_api_values(
         "https://graph.microsoft.com/v1.0/directory/administrativeUnits/{}/members".format(au),
         access_token,
+        params=odata_params(select, filter, top),
     )
 
-def list_administrative_unit_role_members(access_token, au):
-    return request_az_api_values_until_no_more(
+def list_administrative_unit_role_members(
+        access_token, au, select=None, filter=None, top=None
+):
+    return list(iter_administrative_unit_role_members(
+        access_token, au, select=select, filter=filter, top=top
+    ))
+
+def iter_administrative_unit_role_members(
+        access_token, au, select=None, filter=None, top=None
+):
+    return iter_az_api_values(
         "https://graph.microsoft.com/v1.0/directory/administrativeUnits/{}/scopedRoleMembers".format(au),
         access_token,
+        params=odata_params(select, filter, top),
+    )
+
+def iter_groups(access_token, select=None, filter=None, top=None):
+    return iter_az_api_values(
+        "https://graph.microsoft.com/v1.0/groups",
+        access_token,
+        params=odata_params(select, filter, top),
+    )
+
+def iter_directory_roles(access_token, select=None, filter=None):
+    return iter_az_api_values(
+        "https://graph.microsoft.com/v1.0/directoryRoles",
+        access_token,
+        params=odata_params(select, filter),
+    )
+
+def iter_administrative_units(access_token, select=None, filter=None, top=None):
+    return iter_az_api_values(
+        "https://graph.microsoft.com/v1.0/directory/administrativeUnits",
+        access_token,
+        params=odata_params(select, filter, top),
+    )
+
+def odata_params(select=None, filter=None, top=None):
+    """Build the OData query parameters to only retrieve the select
+    properties of the objects that match the filter, in pages of top
+    objects.
+    """
+    params = {}
+    if select:
+        params["$select"] = ",".join(select)
+    if filter:
+        params["$filter"] = filter
+    if top:
+        params["$top"] = top
+    return params
+
+def show_ad_roles(
+        access_token, role_ids, select=None, workers=DEFAULT_BATCH_WORKERS
+):
+    return batch_get(
+        access_token,
+        role_ids,
+        "/directoryRoles/{}",
+        params=odata_params(select),
+        workers=workers,
+    )
+
+def show_administrative_units(
+        access_token, aus, select=None, workers=DEFAULT_BATCH_WORKERS
+):
+    return batch_get(
+        access_token,
+        aus,
+        "/directory/administrativeUnits/{}",
+        params=odata_params(select),
+        workers=workers,
+    )
+
+def list_users_memberof(
+        access_token,
+        users,
+        select=None,
+        filter=None,
+        top=None,
+        workers=DEFAULT_BATCH_WORKERS,
+):
+    return batch_get(
+        access_token,
+        users,
+        "/users/{}/memberOf",
+        params=odata_params(select, filter, top),
+        workers=workers,
+        paged=True,
+    )
+
+def list_sps_app_role_asignments(
+        access_token,
+        sp_ids=None,
+        app_ids=None,
+        select=None,
+        filter=None,
+        top=None,
+        workers=DEFAULT_BATCH_WORKERS,
+):
+    if sp_ids is not None:
+        targets = sp_ids
+        path_format = "/servicePrincipals/{}/appRoleAssignments"
+    elif app_ids is not None:
+        targets = app_ids
+        path_format = "/servicePrincipals(appId='{}')/appRoleAssignments"
+    else:
+        raise ValueError("Must provide sp_ids or app_ids")
+
+    return batch_get(
+        access_token,
+        targets,
+        path_format,
+        params=odata_params(select, filter, top),
+        workers=workers,
+        paged=True,
+    )
+
+def list_groups_members(
+        access_token,
+        groups,
+        select=None,
+        top=MAX_PAGE_SIZE,
+        workers=DEFAULT_BATCH_WORKERS,
+):
+    return batch_get(
+        access_token,
+        groups,
+        "/groups/{}/members",
+        params=odata_params(select, top=top),
+        workers=workers,
+        paged=True,
     )
+
+def list_directory_roles_members(
+        access_token, role_ids, select=None, workers=DEFAULT_BATCH_WORKERS
+):
+    return batch_get(
+        access_token,
+        role_ids,
+        "/directoryRoles/{}/members",
+        params=odata_params(select),
+        workers=workers,
+        paged=True,
+    )
+
+def list_administrative_units_members(
+        access_token,
+        aus,
+        select=None,
+        top=MAX_PAGE_SIZE,
+        workers=DEFAULT_BATCH_WORKERS,
+):
+    return batch_get(
+        access_token,
+        aus,
+        "/directory/administrativeUnits/{}/members",
+        params=odata_params(select, top=top),
+        workers=workers,
+        paged=True,
+    )
+
+def batch_get(
+        access_token,
+        targets,
+        path_format,
+        params=None,
+        workers=DEFAULT_BATCH_WORKERS,
+        paged=False,
+):
+    """Request the Graph path of each target with the query params,
+    packing up to MAX_BATCH_REQUESTS requests in each $batch request and
+    sending up to workers batches concurrently. Yields (target, response,
+    error) in the order of targets, where error is an AzeRequestError if
+    the request of that target failed. If paged, the response is the list
+    of values of every page. At most 2 * workers batches wait to be
+    yielded, so memory doesn't grow with the number of targets.
+    """
+    query = "?" + urlencode(params, safe="$,", quote_via=quote) \
+        if params else ""
+
+    targets = iter(targets)
+    with BoundedExecutor(workers) as pool:
+        futures = deque()
+        while True:
+            batch = list(islice(targets, MAX_BATCH_REQUESTS))
+            if not batch:
+                break
+            futures.append(pool.submit(
+                request_batch, access_token, batch, path_format, paged, query
+            ))
+            while futures and futures[0].done():
+                yield from futures.popleft().result()
+
+            # The executor frees a slot as soon as any batch completes,
+            # so a slow first batch must also stop new submissions, or
+            # the results of all the following ones would pile up here
+            if len(futures) >= 2 * workers:
+                yield from futures.popleft().result()
+
+        while futures:
+            yield from futures.popleft().result()
+
+def send_batch(access_token, requests, policy=DEFAULT_RETRY_POLICY):
+    """Send the requests in a $batch request and return their responses by
+    id. Requests throttled individually inside the batch are sent again
+    in a new batch, after the longest Retry-After of them, following the
+    retry policy.
+    """
+    responses = {}
+    pending = requests
+    attempt = 0
+    while pending:
+        resp = request_az_api(
+            GRAPH_BATCH_URL,
+            access_token,
+            method="POST",
+            json={"requests": pending},
+        )
+
+        retry_ids = set()
+        delay = 0
+        for item in resp.get("responses", []):
+            responses[item["id"]] = item
+            if not policy.is_retryable("GET", item["status"]):
+                continue
+            item_delay = policy.get_delay(
+                attempt,
+                CaseInsensitiveDict(item.get("headers") or {}),
+            )
+            if policy.should_retry(attempt, item_delay):
+                retry_ids.add(item["id"])
+                delay = max(delay, item_delay)
+
+        pending = [r for r in pending if r["id"] in retry_ids]
+        if pending:
+            time.sleep(delay)
+            attempt += 1
+
+    return responses
+
+def request_batch(
+        access_token, targets, path_format, paged=False, query=""
+):
+    """Send a $batch request with a GET per target and return the list of
+    (target, response, error) of each one.
+    """
+    requests = [
+        {
+            "id": str(i),
+            "method": "GET",
+            "url": path_format.format(target) + query,
+        }
+        for i, target in enumerate(targets)
+    ]
+
+    try:
+        responses = send_batch(access_token, requests)
+    except AzeRequestError as ex:
+        return [(target, None, ex) for target in targets]
+
+    results = []
+    for i, target in enumerate(targets):
+        item = responses.get(str(i))
+        if item is None:
+            results.append((
+                target, None, AzeRequestError("Missing response in batch")
+            ))
+            continue
+
+        body = item.get("body") or {}
+        if item["status"] != 200:
+            error = body.get("error", {}) if isinstance(body, dict) else {}
+            results.append((target, None, AzeRequestError(
+                "Error {} in response: {} ({})".format(
+                    item["status"],
+                    error.get("code", ""),
+                    error.get("message", ""),
+                ))))
+            continue
+
+        if not paged:
+            results.append((target, body, None))
+            continue
+
+        values = body["value"]
+        next_link = body.get("@odata.nextLink")
+        try:
+            if next_link:
+                values.extend(request_az_api_values_until_no_more(
+                    next_link, access_token
+                ))
+        except AzeRequestError as ex:
+            results.append((target, None, ex))
+            continue
+        results.append((target, values, None))
+
+    return results
@@ -0,0 +1,157 @@
+import logging
+import threading
+from http.cookiejar import DefaultCookiePolicy
+import requests
+from requests.adapters import HTTPAdapter
+from . import retry
+
+logger = logging.getLogger("aze")
+
+# Shared HTTP client for every module of aze. A single requests.Session
+# keeps a keep-alive connection pool per host, so consecutive requests
+# to the same host reuse the TCP+TLS connection instead of performing a
+# new handshake each time.
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_POOL_HOSTS = 20
+DEFAULT_TIMEOUT = None
+
+_config = {
+    "pool_size": DEFAULT_POOL_SIZE,
+    "pool_hosts": DEFAULT_POOL_HOSTS,
+    "timeout": DEFAULT_TIMEOUT,
+    "headers": {},
+}
+_session = None
+_session_lock = threading.Lock()
+
+
+def configure_session(
+        pool_size=None,
+        pool_hosts=None,
+        timeout=None,
+        headers=None,
+):
+    """Set the parameters of the shared session. Must be called before the
+    first request to take effect, otherwise the current session is
+    discarded and a new one is created in the next request.
+
+    pool_size: Max number of keep-alive connections per host. Should be
+    at least the number of concurrent workers.
+    pool_hosts: Number of hosts whose pools are kept.
+    timeout: Default timeout for requests, in seconds or as
+    (connect, read) tuple. Can be overriden per request.
+    headers: Default headers sent in every request.
+    """
+    global _session
+    with _session_lock:
+        if pool_size is not None:
+            _config["pool_size"] = pool_size
+        if pool_hosts is not None:
+            _config["pool_hosts"] = pool_hosts
+        if timeout is not None:
+            _config["timeout"] = timeout
+        if headers is not None:
+            _config["headers"] = dict(headers)
+
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+def get_session():
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _build_session()
+    return _session
+
+
+def _build_session():
+    session = requests.Session()
+
+    # Behave as the module level requests functions, that don't keep
+    # cookies between requests, to avoid state shared across candidates
+    # in bruteforce tools.
+    session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+
+    adapter = HTTPAdapter(
+        pool_connections=_config["pool_hosts"],
+        pool_maxsize=_config["pool_size"],
+        pool_block=False,
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update(_config["headers"])
+    return session
+
+
+def request(method, url, retry_policy=None, **kwargs):
+    """Send a request through the shared session. If a retry_policy is
+    given, throttled and failed requests are retried following it, and
+    concurrent requests to the host are adapted to its throttling. See
+    the retry module.
+    """
+    kwargs.setdefault("timeout", _config["timeout"])
+    if retry_policy is None:
+        return get_session().request(method, url, **kwargs)
+    return retry.request_with_retry(
+        get_session(), method, url, policy=retry_policy, **kwargs
+    )
+
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+
+def post(url, data=None, json=None, **kwargs):
+    return request("POST", url, data=data, json=json, **kwargs)
+
+
+def head(url, **kwargs):
+    kwargs.setdefault("allow_redirects", False)
+    return request("HEAD", url, **kwargs)
+
+
+def get_stats():
+    """Return the connections opened and requests sent per host through
+    the shared session. Each new connection implies a TCP (and TLS)
+    handshake. Hosts with requests sent with a retry policy also include
+    their throttle counters.
+    """
+    stats = {}
+    for host, throttle_stats in retry.get_throttle_stats().items():
+        stats[host] = {"connections": 0, "requests": 0}
+        stats[host].update(throttle_stats)
+
+    if _session is None:
+        return stats
+
+    for adapter in set(_session.adapters.values()):
+        pools = adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            host = "{}://{}:{}".format(pool.scheme, pool.host, pool.port)
+            host_stats = stats.setdefault(
+                host, {"connections": 0, "requests": 0}
+            )
+            host_stats["connections"] += pool.num_connections
+            host_stats["requests"] += pool.num_requests
+
+    return stats
+
+
+def log_stats():
+    """Log at info level the stats of each host, see get_stats. Meant to
+    be called by the commands at the end of the run.
+    """
+    for host, host_stats in sorted(get_stats().items()):
+        logger.info("HTTP stats of %s: %s", host, " ".join(
+            "{}={}".format(
+                key, round(value, 2) if isinstance(value, float) else value
+            )
+            for key, value in host_stats.items()
+        ))
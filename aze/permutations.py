@@ -53,7 +53,6 @@ DEFAULT_PERMUTATIONS = [
     "public",
     "qa",
     "repo",
-    "repo",
     "root",
     "secret",
     "secrets",
@@ -1,6 +1,7 @@
 import codecs
 import os
 import json
+from . import utils
 
 def get_azure_profile_filepath():
     return "{}/.azure/azureProfile.json".format(os.environ["HOME"])
@@ -12,8 +13,11 @@ def load_profile():
     return profile_data
 
 def store_profile(profile_data):
-    with codecs.open(get_azure_profile_filepath(), 'w', 'utf-8-sig') as fo:
-        json.dump(profile_data, fo)
+    utils.atomic_write(
+        get_azure_profile_filepath(),
+        json.dumps(profile_data),
+        encoding="utf-8-sig",
+    )
 
 
 def get_profile_subscriptions(profile=None):
@@ -1,3 +1,4 @@
+import os
 import sys
 
 def read_text_targets(
@@ -21,6 +22,13 @@ def read_text_targets(
         remove_empty=remove_empty,
     )
 
+def is_single_target(targets):
+    """Check if targets is a single value given in the command line, not
+    a file nor stdin.
+    """
+    return bool(targets) and len(targets) == 1 and targets[0] != "-" \
+        and not os.path.isfile(targets[0])
+
 def _read_targets(
         targets, use_stdin_if_none, use_stdin_if_minus, try_read_file
 ):
@@ -40,7 +48,9 @@ def _read_targets(
                 with open(target) as fi:
                     yield from fi
                 continue
-            except FileNotFoundError:
+            except OSError:
+                # Not a file (or a name too long to be one, as a JWT),
+                # so it is taken as a value
                 pass
 
         if target == "-" and use_stdin_if_minus:
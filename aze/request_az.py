@@ -1,15 +1,26 @@
-import requests
+from . import http_session
 from .error import AzeRequestError
+from .retry import DEFAULT_RETRY_POLICY
 
-def request_az_api_values_until_no_more(url, access_token):
-    values = []
+def request_az_api_values_until_no_more(url, access_token, params=None):
+    return list(iter_az_api_values(url, access_token, params=params))
+
+def iter_az_api_values(url, access_token, params=None):
+    for page in iter_az_api_pages(url, access_token, params=params):
+        yield from page
+
+def iter_az_api_pages(url, access_token, params=None):
+    """Lazily request the pages of a paged response, following the
+    @odata.nextLink, and yield the values of each page as they arrive.
+    The params are only sent in the first request, since the next links
+    already include them.
+    """
     next_link = url
     while next_link:
-        resp = request_az_api(next_link, access_token)
-        values.extend(resp["value"])
+        resp = request_az_api(next_link, access_token, params=params)
+        yield resp["value"]
         next_link = resp.get("@odata.nextLink", "")
-
-    return values
+        params = None
 
 def request_az_api(url, access_token, method="GET", json=None, params=None):
     headers = {
@@ -17,24 +28,44 @@ def request_az_api(url, access_token, method="GET", json=None, params=None):
     }
 
     if method.upper() == "POST":
-        req = requests.post
+        method = "POST"
     else:
-        req = requests.get
+        method = "GET"
 
-    resp = req(
+    resp = http_session.request(
+        method,
         url,
         headers=headers,
         json=json,
         params=params,
+        retry_policy=DEFAULT_RETRY_POLICY,
         # verify=False,
     )
 
     if resp.status_code != 200:
+        code, message = get_error_details(resp)
         raise AzeRequestError(
             "Error {} in response: {} ({})".format(
                 resp.status_code,
-                resp.json()["error"]["code"],
-                resp.json()["error"]["message"],
+                code,
+                message,
         ))
 
     return resp.json()
+
+def get_error_details(resp):
+    """Return the code and message of an error response. Throttled and
+    gateway responses may not have a json body with them.
+    """
+    try:
+        error = resp.json().get("error", {})
+    except ValueError:
+        error = {}
+
+    if not isinstance(error, dict):
+        return error, ""
+
+    return (
+        error.get("code", resp.reason),
+        error.get("message", resp.text[:200]),
+    )
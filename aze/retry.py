@@ -0,0 +1,268 @@
+import email.utils
+import logging
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+import requests
+
+logger = logging.getLogger("aze")
+
+# Retry policy shared by the ARM, Graph and Storage requests. Throttled
+# (429) and unavailable (5xx) responses are retried after the delay given
+# by Retry-After, or with jittered exponential backoff if missing. Each
+# host has an adaptive limiter of concurrent requests that is halved when
+# the host throttles and slowly increased while it doesn't, so all the
+# workers slow down together instead of hammering the host.
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+DEFAULT_MAX_RETRIES = 6
+DEFAULT_BACKOFF_BASE = 1
+DEFAULT_BACKOFF_MAX = 60
+# Requests whose Retry-After is longer than this are not retried
+DEFAULT_MAX_RETRY_AFTER = 5 * 60
+
+# Below this number of remaining requests in a x-ms-ratelimit-remaining-*
+# header the host is considered about to throttle
+RATELIMIT_REMAINING_LOW = 10
+
+IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE")
+DEFAULT_PORTS = {"https": 443, "http": 80}
+
+
+class RetryPolicy:
+
+    def __init__(
+            self,
+            max_retries=DEFAULT_MAX_RETRIES,
+            backoff_base=DEFAULT_BACKOFF_BASE,
+            backoff_max=DEFAULT_BACKOFF_MAX,
+            max_retry_after=DEFAULT_MAX_RETRY_AFTER,
+            statuses=RETRY_STATUSES,
+    ):
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_retry_after = max_retry_after
+        self.statuses = statuses
+
+    def is_retryable(self, method, status):
+        if status not in self.statuses:
+            return False
+        # Non idempotent requests are only retried when the server
+        # refused to process them
+        return method.upper() in IDEMPOTENT_METHODS or status == 429
+
+    def get_delay(self, attempt, headers=None):
+        """Seconds to wait before the retry number attempt (starting at 0).
+        The delay requested by the server in the response headers is
+        honored as given, otherwise a random delay up to the exponential
+        backoff is used (full jitter), to avoid that all the workers retry
+        at the same time.
+        """
+        if headers is not None:
+            delay = get_retry_after(headers)
+            if delay is not None:
+                return delay
+
+        backoff = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+        return random.uniform(0, backoff)
+
+    def should_retry(self, attempt, delay):
+        """Check if there are retries left and the delay is acceptable,
+        since retrying earlier than requested by the server would only
+        waste the retries.
+        """
+        return attempt < self.max_retries and delay <= self.max_retry_after
+
+
+DEFAULT_RETRY_POLICY = RetryPolicy()
+
+
+def get_retry_after(headers):
+    """Return the seconds to wait from the Retry-After (seconds or HTTP
+    date) or x-ms-retry-after-ms headers, or None if not present.
+    """
+    value = headers.get("x-ms-retry-after-ms")
+    if value:
+        try:
+            return max(float(value) / 1000, 0)
+        except ValueError:
+            pass
+
+    value = headers.get("Retry-After")
+    if not value:
+        return None
+
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(date.timestamp() - time.time(), 0)
+
+
+def is_ratelimit_low(headers):
+    for name, value in headers.items():
+        if not name.lower().startswith("x-ms-ratelimit-remaining-"):
+            continue
+        try:
+            if int(value) <= RATELIMIT_REMAINING_LOW:
+                return True
+        except ValueError:
+            pass
+    return False
+
+
+class AdaptiveLimiter:
+    """Limits the concurrent requests to a host with AIMD. There is no
+    limit until the host throttles, then the limit is set to half of the
+    requests in flight, halved on each new throttle and increased by one
+    every limit successful requests, until it reaches the concurrency
+    used before throttling. A throttle response with Retry-After also
+    blocks new requests to the host until the delay passes.
+    """
+
+    def __init__(self):
+        self.limit = None
+        self._peak = 0
+        self._in_flight = 0
+        self._resume_at = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while True:
+                wait = self._resume_at - time.time()
+                if wait > 0:
+                    self._cond.wait(wait)
+                elif self.limit is not None \
+                     and self._in_flight >= int(self.limit):
+                    self._cond.wait()
+                else:
+                    break
+            self._in_flight += 1
+            self._peak = max(self._peak, self._in_flight)
+
+    def release(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    def on_success(self):
+        with self._cond:
+            if self.limit is None:
+                return
+            self.limit += 1 / self.limit
+            if self.limit >= self._peak:
+                self.limit = None
+            self._cond.notify_all()
+
+    def on_throttle(self, delay=0):
+        with self._cond:
+            if self.limit is None:
+                self.limit = float(self._in_flight)
+            self.limit = max(1.0, self.limit / 2)
+            self._resume_at = max(self._resume_at, time.time() + delay)
+
+
+_limiters = {}
+_throttle_stats = {}
+_state_lock = threading.Lock()
+
+
+def get_limiter(host):
+    with _state_lock:
+        limiter = _limiters.get(host)
+        if limiter is None:
+            limiter = AdaptiveLimiter()
+            _limiters[host] = limiter
+        return limiter
+
+
+def _count(host, key, value=1):
+    with _state_lock:
+        stats = _throttle_stats.setdefault(
+            host,
+            {"throttled": 0, "retries": 0, "retry_wait": 0.0, "failures": 0},
+        )
+        stats[key] += value
+
+
+def get_throttle_stats():
+    """Return per host the throttled responses, the retries, the seconds
+    waited before retrying and the requests that failed after all the
+    retries.
+    """
+    with _state_lock:
+        stats = {}
+        for host, host_stats in _throttle_stats.items():
+            host_stats = dict(host_stats)
+            limiter = _limiters.get(host)
+            if limiter is not None and limiter.limit is not None:
+                host_stats["concurrency_limit"] = int(limiter.limit)
+            stats[host] = host_stats
+        return stats
+
+
+def request_with_retry(
+        session,
+        method,
+        url,
+        policy=DEFAULT_RETRY_POLICY,
+        **kwargs
+):
+    parts = urlsplit(url)
+    host = "{}://{}:{}".format(
+        parts.scheme,
+        parts.hostname,
+        parts.port or DEFAULT_PORTS.get(parts.scheme),
+    )
+    limiter = get_limiter(host)
+
+    attempt = 0
+    while True:
+        limiter.acquire()
+        try:
+            resp = session.request(method, url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as ex:
+            if attempt >= policy.max_retries \
+               or method.upper() not in IDEMPOTENT_METHODS:
+                _count(host, "failures")
+                raise
+            delay = policy.get_delay(attempt)
+            logger.debug(
+                "Error in request to %s: %s. Retrying in %.2fs",
+                host, ex, delay
+            )
+        else:
+            if not policy.is_retryable(method, resp.status_code):
+                if is_ratelimit_low(resp.headers):
+                    limiter.on_throttle()
+                else:
+                    limiter.on_success()
+                return resp
+
+            _count(host, "throttled")
+            delay = policy.get_delay(attempt, resp.headers)
+            limiter.on_throttle(min(delay, policy.max_retry_after))
+            if not policy.should_retry(attempt, delay):
+                _count(host, "failures")
+                return resp
+
+            logger.debug(
+                "Response %s from %s. Retrying in %.2fs",
+                resp.status_code, host, delay
+            )
+            resp.close()
+        finally:
+            limiter.release()
+
+        _count(host, "retries")
+        _count(host, "retry_wait", delay)
+        time.sleep(delay)
+        attempt += 1
@@ -1,73 +1,221 @@
-import requests
+from . import http_session
 from .error import AzeRequestError
+from .retry import DEFAULT_RETRY_POLICY
 from xml.etree import ElementTree
+import requests
+import urllib3
+
+API_VERSION = "2023-08-03"
+LIST_INCLUDE_OPTIONS = ["metadata", "snapshots", "versions", "deleted"]
 
 def download_blob(url, access_token=None):
-    if access_token:
-        headers = {
-            "Authorization": "Bearer " + access_token,
-            "x-ms-version": "2023-08-03",
-        }
+    return request_blob(url, access_token=access_token).content
+
+def request_blob(
+        url,
+        access_token=None,
+        byte_range=None,
+        if_match=None,
+        stream=False,
+):
+    """Send a Get Blob request. byte_range is a (start, end) tuple, both
+    included, to retrieve only part of the blob. if_match is the ETag the
+    blob must have, to avoid mixing ranges of different versions.
+    """
+    headers = build_headers(access_token)
+    if byte_range:
+        headers["Range"] = "bytes={}-{}".format(*byte_range)
+        expected_status = 206
     else:
-        headers = None
+        expected_status = 200
+    if if_match:
+        headers["If-Match"] = normalize_etag(if_match)
 
-    resp = requests.get(
+    resp = http_session.get(
         url,
         headers=headers,
+        stream=stream,
+        retry_policy=DEFAULT_RETRY_POLICY,
     )
 
-    if resp.status_code != 200:
+    if resp.status_code != expected_status:
+        resp.close()
         raise AzeRequestError(
             "Unable to download file in {}. Error code {}".format(
                 url, resp.status_code
             )
         )
 
-    return resp.content
+    return resp
+
+def get_blob_properties(url, access_token=None):
+    resp = http_session.head(
+        url,
+        headers=build_headers(access_token),
+        retry_policy=DEFAULT_RETRY_POLICY,
+    )
+
+    if resp.status_code != 200:
+        raise AzeRequestError(
+            "Unable to get properties of file in {}. Error code {}".format(
+                url, resp.status_code
+            )
+        )
+
+    return {
+        "content_length": int(resp.headers.get("Content-Length", 0)),
+        "etag": resp.headers.get("ETag", ""),
+        "last_modified": resp.headers.get("Last-Modified", ""),
+        "content_md5": resp.headers.get("Content-MD5", ""),
+    }
+
+def normalize_etag(etag):
+    """Listings return the ETag without the quotes of the ETag header."""
+    if etag and not etag.startswith('"'):
+        return '"{}"'.format(etag)
+    return etag
+
+def build_headers(access_token=None):
+    if access_token:
+        return {
+            "Authorization": "Bearer " + access_token,
+            "x-ms-version": API_VERSION,
+        }
+    return {}
+
+def list_blobs(
+        url,
+        access_token=None,
+        prefix=None,
+        delimiter=None,
+        maxresults=None,
+        include=None,
+):
+    """List the blobs of a container url, or the containers if url is a
+    storage account. With delimiter, the blobs under a virtual directory
+    of prefix are returned as a single record of type prefix.
 
-def list_blobs(url, access_token=None):
+    maxresults is the page size (up to 5000) and include a list of
+    LIST_INCLUDE_OPTIONS to retrieve additional blobs or properties.
+    """
     marker = None
     while True:
         resp = request_container_files(
-            url, marker=marker, access_token=access_token
+            url,
+            marker=marker,
+            access_token=access_token,
+            prefix=prefix,
+            delimiter=delimiter,
+            maxresults=maxresults,
+            include=include,
+            stream=True,
         )
-        if resp.status_code != 200:
-            raise AzeRequestError(
-                "Unable to list files in {}. Error code {}".format(
-                    url, resp.status_code
+        with resp:
+            if resp.status_code != 200:
+                raise AzeRequestError(
+                    "Unable to list files in {}. Error code {}".format(
+                        url, resp.status_code
+                    )
                 )
-            )
-            break
 
-        yield from extract_blobs(resp.text)
-        yield from extract_containers(resp.text)
+            # The page is parsed completely before yielding its records,
+            # to release the connection instead of keeping it idle while
+            # the consumer is busy, what could make the server close it
+            resp.raw.decode_content = True
+            try:
+                records, marker = parse_listing_page(resp.raw)
+            except (
+                    requests.RequestException,
+                    urllib3.exceptions.HTTPError,
+                    ElementTree.ParseError,
+            ) as ex:
+                raise AzeRequestError(
+                    "Error reading list of files in {}: {}".format(url, ex)
+                )
 
-        marker = extract_marker(resp.text)
+        yield from records
         if not marker:
             break
 
+def parse_listing_page(source):
+    """Return the records and the NextMarker of a listing page."""
+    records = []
+    parser = iterparse_listing(source)
+    while True:
+        try:
+            records.append(next(parser))
+        except StopIteration as stop:
+            return records, stop.value
 
+def iterparse_listing(source):
+    """Parse a listing of blobs or containers from a file object in a
+    single pass, yielding the records as their elements are completed and
+    discarding them afterwards, so memory doesn't depend on the page
+    size. Returns the NextMarker.
+    """
+    marker = None
+    stack = []
+    for event, elem in ElementTree.iterparse(source, events=("start", "end")):
+        if event == "start":
+            stack.append(elem)
+            continue
 
-def request_container_files(url, marker=None, access_token=None):
+        stack.pop()
+        if elem.tag == "Blob" and len(stack) == 2:
+            yield blob_from_element(elem)
+            stack[-1].remove(elem)
+        elif elem.tag == "Container" and len(stack) == 2:
+            yield container_from_element(elem)
+            stack[-1].remove(elem)
+        elif elem.tag == "BlobPrefix" and len(stack) == 2:
+            yield prefix_from_element(elem)
+            stack[-1].remove(elem)
+        elif elem.tag == "NextMarker" and len(stack) == 1:
+            marker = elem.text
+
+    return marker
+
+def request_container_files(
+        url,
+        marker=None,
+        access_token=None,
+        prefix=None,
+        delimiter=None,
+        maxresults=None,
+        include=None,
+        stream=False,
+        retry_policy=DEFAULT_RETRY_POLICY,
+):
+    """Request a page of the listing of a container, or of the containers
+    of an account. Bruteforce probes should pass a None retry_policy to
+    get the throttle responses as they are.
+    """
     params = {
         "restype": "container",
         "comp": "list"
     }
     if marker:
         params["marker"] = marker
+    if prefix:
+        params["prefix"] = prefix
+    if delimiter:
+        params["delimiter"] = delimiter
+    if maxresults:
+        params["maxresults"] = maxresults
 
-    if access_token:
-        headers = {
-            "Authorization": "Bearer " + access_token,
-            "x-ms-version": "2023-08-03",
-        }
-    else:
-        headers = None
+    headers = build_headers(access_token)
+    if include:
+        params["include"] = ",".join(include)
+        # Anonymous requests use an old version by default, that doesn't
+        # support all the include options
+        headers.setdefault("x-ms-version", API_VERSION)
 
-    resp = requests.get(
+    resp = http_session.get(
         url,
         params=params,
         headers=headers,
+        stream=stream,
+        retry_policy=retry_policy,
     )
     return resp
 
@@ -78,63 +226,93 @@ def extract_marker(text):
 def extract_blobs(text):
     root = ElementTree.fromstring(text)
     for blob in root.findall("Blobs/Blob"):
-        name = blob.find("Name").text
-        p = blob.find("Properties")
-        last_modified = p.find("Last-Modified").text or ""
-        etag = p.find("Etag").text or ""
-        content_length = int(p.find("Content-Length").text)
-        content_type = p.find("Content-Type").text or ""
-        content_encoding = p.find("Content-Encoding").text or ""
-        content_language = p.find("Content-Language").text or ""
-        content_md5 = p.find("Content-MD5").text or ""
-        cache_control = p.find("Cache-Control").text or ""
-        content_disposition = p.find("Content-Disposition").text or ""
-        blob_type = p.find("BlobType").text or ""
-        lease_status = p.find("LeaseStatus").text or ""
-        lease_state = p.find("LeaseState").text or ""
-
-        yield {
-            "type": "blob",
-            "name": name,
-            "last_modified": last_modified,
-            "etag": etag,
-            "content_length": content_length,
-            "content_type": content_type,
-            "content_encoding": content_encoding,
-            "content_language": content_language,
-            "content_md5": content_md5,
-            "cache_control": cache_control,
-            "content_disposition": content_disposition,
-            "blob_type": blob_type,
-            "lease_status": lease_status,
-            "lease_state": lease_state,
-        }
+        yield blob_from_element(blob)
 
 def extract_containers(text):
     root = ElementTree.fromstring(text)
     for c in root.findall("Containers/Container"):
-        name = c.find("Name").text
-        p = c.find("Properties")
-        last_modified = p.find("Last-Modified").text or ""
-        etag = p.find("Etag").text or ""
-        lease_status = p.find("LeaseStatus").text or ""
-        lease_state = p.find("LeaseState").text or ""
-        default_encryption_scope = p.find("DefaultEncryptionScope").text or ""
-        deny_encryption_scope_override = p.find("DenyEncryptionScopeOverride").text or ""
-        has_immutability_policy = p.find("HasImmutabilityPolicy").text or ""
-        has_legal_hold = p.find("HasLegalHold").text or ""
-        immutable_storage_with_versioning_enabled = p.find("ImmutableStorageWithVersioningEnabled").text or ""
-
-        yield {
-            "type": "container",
-            "name": name,
-            "last_modified": last_modified,
-            "etag": etag,
-            "lease_status": lease_status,
-            "lease_state": lease_state,
-            "default_encryption_scope": default_encryption_scope,
-            "deny_encryption_scope_override": deny_encryption_scope_override,
-            "has_immutability_policy": has_immutability_policy,
-            "has_legal_hold": has_legal_hold,
-            "immutable_storage_with_versioning_enabled": immutable_storage_with_versioning_enabled,
-        }
+        yield container_from_element(c)
+
+def blob_from_element(blob):
+    name = blob.find("Name").text
+    p = blob.find("Properties")
+    last_modified = p.find("Last-Modified").text or ""
+    etag = p.find("Etag").text or ""
+    content_length = int(p.find("Content-Length").text)
+    content_type = p.find("Content-Type").text or ""
+    content_encoding = p.find("Content-Encoding").text or ""
+    content_language = p.find("Content-Language").text or ""
+    content_md5 = p.find("Content-MD5").text or ""
+    cache_control = p.find("Cache-Control").text or ""
+    content_disposition = p.find("Content-Disposition").text or ""
+    blob_type = p.find("BlobType").text or ""
+    lease_status = p.find("LeaseStatus").text or ""
+    lease_state = p.find("LeaseState").text or ""
+
+    record = {
+        "type": "blob",
+        "name": name,
+        "last_modified": last_modified,
+        "etag": etag,
+        "content_length": content_length,
+        "content_type": content_type,
+        "content_encoding": content_encoding,
+        "content_language": content_language,
+        "content_md5": content_md5,
+        "cache_control": cache_control,
+        "content_disposition": content_disposition,
+        "blob_type": blob_type,
+        "lease_status": lease_status,
+        "lease_state": lease_state,
+    }
+
+    # Only present when requested with include
+    snapshot = blob.find("Snapshot")
+    if snapshot is not None:
+        record["snapshot"] = snapshot.text or ""
+    version_id = blob.find("VersionId")
+    if version_id is not None:
+        record["version_id"] = version_id.text or ""
+        record["is_current_version"] = \
+            blob.findtext("IsCurrentVersion", "") == "true"
+    deleted = blob.find("Deleted")
+    if deleted is not None:
+        record["deleted"] = deleted.text == "true"
+    metadata = blob.find("Metadata")
+    if metadata is not None:
+        record["metadata"] = {m.tag: m.text or "" for m in metadata}
+
+    return record
+
+def prefix_from_element(prefix):
+    return {
+        "type": "prefix",
+        "name": prefix.find("Name").text,
+    }
+
+def container_from_element(c):
+    name = c.find("Name").text
+    p = c.find("Properties")
+    last_modified = p.find("Last-Modified").text or ""
+    etag = p.find("Etag").text or ""
+    lease_status = p.find("LeaseStatus").text or ""
+    lease_state = p.find("LeaseState").text or ""
+    default_encryption_scope = p.find("DefaultEncryptionScope").text or ""
+    deny_encryption_scope_override = p.find("DenyEncryptionScopeOverride").text or ""
+    has_immutability_policy = p.find("HasImmutabilityPolicy").text or ""
+    has_legal_hold = p.find("HasLegalHold").text or ""
+    immutable_storage_with_versioning_enabled = p.find("ImmutableStorageWithVersioningEnabled").text or ""
+
+    return {
+        "type": "container",
+        "name": name,
+        "last_modified": last_modified,
+        "etag": etag,
+        "lease_status": lease_status,
+        "lease_state": lease_state,
+        "default_encryption_scope": default_encryption_scope,
+        "deny_encryption_scope_override": deny_encryption_scope_override,
+        "has_immutability_policy": has_immutability_policy,
+        "has_legal_hold": has_legal_hold,
+        "immutable_storage_with_versioning_enabled": immutable_storage_with_versioning_enabled,
+    }
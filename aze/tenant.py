@@ -1,4 +1,4 @@
-import requests
+from . import http_session
 from . import utils
 
 def resolve_tenant_id(tenant):
@@ -9,7 +9,7 @@ def resolve_tenant_id(tenant):
 
 def request_tenant_id(domain):
     url = "https://login.microsoftonline.com/{}/.well-known/openid-configuration".format(domain)
-    resp = requests.get(url)
+    resp = http_session.get(url)
     if resp.status_code == 200:
         tenant_id = resp.json()["token_endpoint"][34:70]
         return tenant_id
@@ -0,0 +1,105 @@
+import logging
+import threading
+import time
+import requests
+from . import tokens
+from .tokens import CredentialType
+from .error import AzeError
+
+logger = logging.getLogger("aze")
+
+DEFAULT_MARGIN = 10 * 60
+DEFAULT_INTERVAL = 60
+
+
+class TokenRefreshBroker:
+    """Refreshes ahead of time the access tokens of the tracked
+    subscriptions and scopes, so commands always find a valid token in
+    the cache instead of refreshing it themselves.
+
+    Tokens are refreshed when they expire in less than margin seconds,
+    checking every interval seconds. It can run in a background thread
+    of a long-running process with start, or in the foreground with run.
+    """
+
+    def __init__(
+            self,
+            token_cache=None,
+            margin=DEFAULT_MARGIN,
+            interval=DEFAULT_INTERVAL,
+    ):
+        self.token_cache = token_cache or tokens.load_token_cache()
+        self.margin = margin
+        self.interval = interval
+        self._tracked = []
+        self._stop = threading.Event()
+        self._thread = None
+
+    def track(self, subscription, scopes):
+        self._tracked.append((subscription, list(scopes)))
+
+    def refresh_due(self):
+        """Refresh the tracked tokens that are expiring. Returns the number
+        of tokens refreshed.
+        """
+        refreshed = 0
+        for subscription, scopes in self._tracked:
+            try:
+                if self._refresh_if_due(subscription, scopes):
+                    refreshed += 1
+            except (AzeError, requests.RequestException, ValueError) as e:
+                # Retried in the next check, the thread must keep running.
+                # ValueError includes responses that are not json.
+                logger.warning(
+                    "Unable to refresh token of %s for %s: %s",
+                    subscription["user"]["name"], " ".join(scopes), e
+                )
+        return refreshed
+
+    def _refresh_if_due(self, subscription, scopes):
+        account = tokens.find_subscription_account(
+            subscription, self.token_cache
+        )
+        expires_on = self.get_expiration(account, scopes)
+        if expires_on - time.time() > self.margin:
+            return False
+
+        logger.info(
+            "Refreshing token of %s for %s",
+            account["home_account_id"], " ".join(scopes)
+        )
+        tokens.refresh_access_token(
+            subscription, account, scopes, self.token_cache
+        )
+        return True
+
+    def get_expiration(self, account, scopes):
+        """Return when the valid access token of the account for the scopes
+        that lasts longer expires, or 0 if there is none.
+        """
+        access_tokens = tokens.search_token_in_cache(
+            CredentialType.ACCESS_TOKEN,
+            query={"home_account_id": account["home_account_id"]},
+            scopes=scopes,
+            token_cache=self.token_cache,
+        )
+        return max(
+            (int(at["expires_on"]) for at in access_tokens),
+            default=0,
+        )
+
+    def run(self):
+        while not self._stop.is_set():
+            self.refresh_due()
+            self._stop.wait(self.interval)
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
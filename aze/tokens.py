@@ -2,10 +2,15 @@
 from msal_extensions import FilePersistenceWithDataProtection,\
     KeychainPersistence, LibsecretPersistence, FilePersistence,\
     PersistedTokenCache
+from msal_extensions.persistence import PersistenceNotFound
+from msal_extensions.token_cache import CrossPlatLock
+import msal
 import os
+import sys
+import threading
 from .error import AzeError
 from . import utils
-import requests
+from . import http_session
 import json
 import base64
 import time
@@ -22,6 +27,38 @@ CredentialType = PersistedTokenCache.CredentialType
 def search_token_for_subscription(subscription, scopes, token_cache=None):
     token_cache = token_cache or load_token_cache()
 
+    account = find_subscription_account(subscription, token_cache)
+
+    access_tokens = search_token_in_cache(
+        CredentialType.ACCESS_TOKEN,
+        query={"home_account_id": account["home_account_id"]},
+        scopes=scopes,
+        token_cache=token_cache,
+    )
+
+    if not access_tokens:
+        refresh_access_token(subscription, account, scopes, token_cache)
+
+        access_tokens = search_token_in_cache(
+            CredentialType.ACCESS_TOKEN,
+            query={"home_account_id": account["home_account_id"]},
+            scopes=scopes,
+            token_cache=token_cache,
+        )
+
+    if not access_tokens:
+        raise AzeError(
+                "Unable to find Access Token for account '{}' with scope '{}'".format(
+                    account["home_account_id"],
+                    ", ".join(scopes),
+                ))
+
+
+    return access_tokens[0]
+
+def find_subscription_account(subscription, token_cache=None):
+    token_cache = token_cache or load_token_cache()
+
     query = {
         "username": subscription["user"]["name"],
         "realm": subscription["tenantId"],
@@ -43,62 +80,128 @@ def search_token_for_subscription(subscription, scopes, token_cache=None):
     if not accounts:
         raise AzeError("Unable to find account for subscription")
 
-    account = accounts[0]
+    return accounts[0]
 
-    access_tokens = search_token_in_cache(
-        CredentialType.ACCESS_TOKEN,
+def refresh_access_token(subscription, account, scopes, token_cache=None):
+    """Request a new access token for the scopes with the refresh token of
+    the account and store it in the cache.
+    """
+    token_cache = token_cache or load_token_cache()
+
+    refresh_token_obj = search_token_in_cache(
+        CredentialType.REFRESH_TOKEN,
         query={"home_account_id": account["home_account_id"]},
-        scopes=scopes,
         token_cache=token_cache,
     )
+    if not refresh_token_obj:
+        raise AzeError(
+            "Unable to find Access Token (or Refresh Token) for account '{}' with scope '{}'".format(
+                account["home_account_id"],
+                ", ".join(scopes),
+            ))
+
+    tokens = request_tokens_from_refresh(
+        subscription["tenantId"],
+        refresh_token_obj[0]["secret"],
+        " ".join(scopes),
+    )
 
-    if not access_tokens:
-        refresh_token_obj = search_token_in_cache(
-            CredentialType.REFRESH_TOKEN,
-            query={"home_account_id": account["home_account_id"]},
-            token_cache=token_cache,
-        )
-        if not refresh_token_obj:
-            raise AzeError(
-                "Unable to find Access Token (or Refresh Token) for account '{}' with scope '{}'".format(
-                    account["home_account_id"],
-                    ", ".join(scopes),
-                ))
+    at_info = TokenInformation(
+        tokens["access_token"],
+        refresh_token=tokens["refresh_token"],
+        id_token=tokens["id_token"],
+        scope=tokens["scope"],
+        client_info=tokens["client_info"],
+        expires_in=tokens["expires_in"],
+        ext_expires_in=tokens["ext_expires_in"],
+    )
 
-        tokens = request_tokens_from_refresh(
-            subscription["tenantId"],
-            refresh_token_obj[0]["secret"],
-            " ".join(scopes),
-        )
+    store_tokens([at_info], token_cache)
+    return at_info
 
-        at_info = TokenInformation(
-            tokens["access_token"],
-            refresh_token=tokens["refresh_token"],
-            id_token=tokens["id_token"],
-            scope=tokens["scope"],
-            client_info=tokens["client_info"],
-            expires_in=tokens["expires_in"],
-            ext_expires_in=tokens["ext_expires_in"],
-        )
+DEFAULT_EXPIRATION_MARGIN = 5 * 60
 
-        store_tokens([at_info], token_cache)
+class TokenProvider:
+    """Thread-safe access token source for the workers of a command.
+    Tokens are memoized per account and scopes and handed out until
+    margin seconds before they expire. Concurrent requests for the same
+    account and scopes wait for a single cache lookup or refresh
+    instead of doing their own.
+    """
 
-        access_tokens = search_token_in_cache(
-            CredentialType.ACCESS_TOKEN,
-            query={"home_account_id": account["home_account_id"]},
-            scopes=scopes,
-            token_cache=token_cache,
-        )
+    def __init__(
+            self,
+            subscription,
+            token_cache=None,
+            margin=DEFAULT_EXPIRATION_MARGIN,
+    ):
+        self.subscription = subscription
+        self.token_cache = token_cache or load_token_cache()
+        self.margin = margin
+        self._account = None
+        self._tokens = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def get_token(self, scopes):
+        """Return the access token cache entry for the scopes."""
+        key = tuple(sorted(scopes))
+        token = self._tokens.get(key)
+        if self._is_fresh(token):
+            return token
+
+        with self._lock:
+            key_lock = self._locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            # Another worker may have got it while we were waiting
+            token = self._tokens.get(key)
+            if not self._is_fresh(token):
+                token = self._fetch_token(list(key))
+                self._tokens[key] = token
+            return token
+
+    def get_secret(self, scopes):
+        return self.get_token(scopes)["secret"]
+
+    def _is_fresh(self, token):
+        return token is not None \
+            and int(token["expires_on"]) - self.margin > time.time()
+
+    def _fetch_token(self, scopes):
+        with self._lock:
+            if self._account is None:
+                self._account = find_subscription_account(
+                    self.subscription, self.token_cache
+                )
+            account = self._account
+
+        token = self._search_fresh_token(account, scopes)
+        if token is None:
+            refresh_access_token(
+                self.subscription, account, scopes, self.token_cache
+            )
+            token = self._search_fresh_token(account, scopes)
 
-    if not access_tokens:
-        raise AzeError(
+        if token is None:
+            raise AzeError(
                 "Unable to find Access Token for account '{}' with scope '{}'".format(
                     account["home_account_id"],
                     ", ".join(scopes),
                 ))
+        return token
 
-
-    return access_tokens[0]
+    def _search_fresh_token(self, account, scopes):
+        access_tokens = search_token_in_cache(
+            CredentialType.ACCESS_TOKEN,
+            query={"home_account_id": account["home_account_id"]},
+            scopes=scopes,
+            token_cache=self.token_cache,
+        )
+        access_tokens = [at for at in access_tokens if self._is_fresh(at)]
+        if not access_tokens:
+            return None
+        return max(access_tokens, key=lambda at: int(at["expires_on"]))
 
 def search_token_in_cache(
         token_type,
@@ -119,9 +222,143 @@ def load_token_cache(encrypted=False):
     )
 
 
+_token_caches = {}
+
 def load_persisted_token_cache(location, encrypt):
-    persistence = build_persistence(location, encrypt)
-    return PersistedTokenCache(persistence)
+    token_cache = _token_caches.get(location)
+    if token_cache is None:
+        persistence = build_persistence(location, encrypt)
+        token_cache = IndexedTokenCache(
+            PersistedTokenCache(persistence),
+            persistence,
+        )
+        _token_caches[location] = token_cache
+    return token_cache
+
+
+class IndexedTokenCache:
+    """View of a PersistedTokenCache that loads the cache file once and
+    indexes its entries by credential type, the most common query fields
+    and each scope, so searches don't parse the file and scan every
+    entry. The file is reloaded only when its modification time changes.
+    Writes are delegated to the PersistedTokenCache.
+    """
+
+    INDEXED_FIELDS = ("home_account_id", "realm", "username", "client_id")
+
+    def __init__(self, token_cache, persistence):
+        self.token_cache = token_cache
+        self._persistence = persistence
+        self._last_modified = None
+        self._entries = {}
+        self._index = {}
+        self._lock = threading.Lock()
+
+    def add(self, event):
+        self.token_cache.add(event)
+
+    def add_all(self, events):
+        """Merge all the events in memory and write the cache once, while
+        holding the cache lock. PersistedTokenCache.add instead rewrites
+        the whole file for each entry of each event.
+        """
+        location = self._persistence.get_location()
+        with CrossPlatLock(location + ".lockfile"):
+            merged = msal.SerializableTokenCache()
+            try:
+                merged.deserialize(self._persistence.load())
+            except PersistenceNotFound:
+                pass
+
+            for event in events:
+                merged.add(event)
+
+            if self._persistence.is_encrypted:
+                self._persistence.save(merged.serialize())
+            else:
+                utils.atomic_write(location, merged.serialize())
+
+        with self._lock:
+            self._last_modified = None
+
+    def find(self, credential_type, query=None, target=None):
+        with self._lock:
+            self._reload_if_necessary()
+            candidates = self._candidates(credential_type, query, target)
+
+        now = int(time.time())
+        target = set(target or [])
+        query = {
+            k: v.lower() if k == "environment" and isinstance(v, str) else v
+            for k, v in (query or {}).items()
+        }
+        results = []
+        for entry in candidates:
+            if credential_type == CredentialType.ACCESS_TOKEN \
+               and int(entry["expires_on"]) < now:
+                continue
+            if any(entry.get(k) != v for k, v in query.items()):
+                continue
+            if target and not target <= set(entry.get("target", "").split()):
+                continue
+            results.append(entry)
+
+        return results
+
+    def _candidates(self, credential_type, query, target):
+        """Return the smallest list of entries that may match, from the
+        indexes of the query fields and scopes.
+        """
+        candidates = self._entries.get(credential_type, [])
+        keys = [
+            (credential_type, field, query[field])
+            for field in self.INDEXED_FIELDS
+            if query and field in query
+        ]
+        keys.extend(
+            (credential_type, "target", scope)
+            for scope in (target or [])
+        )
+
+        for key in keys:
+            indexed = self._index.get(key, [])
+            if len(indexed) < len(candidates):
+                candidates = indexed
+        return candidates
+
+    def _reload_if_necessary(self):
+        try:
+            last_modified = self._persistence.time_last_modified()
+        except PersistenceNotFound:
+            last_modified = None
+
+        if last_modified == self._last_modified and self._entries:
+            return
+
+        try:
+            data = json.loads(self._persistence.load() or "{}")
+        except PersistenceNotFound:
+            data = {}
+
+        self._entries = {}
+        self._index = {}
+        for credential_type, entries in data.items():
+            if not isinstance(entries, dict):
+                continue
+            entries = list(entries.values())
+            self._entries[credential_type] = entries
+            for entry in entries:
+                for field in self.INDEXED_FIELDS:
+                    if field in entry:
+                        self._index.setdefault(
+                            (credential_type, field, entry[field]), []
+                        ).append(entry)
+                for scope in set(entry.get("target", "").split()):
+                    self._index.setdefault(
+                        (credential_type, "target", scope), []
+                    ).append(entry)
+
+        self._last_modified = last_modified
 
 def build_persistence(location, encrypt):
     if encrypt:
@@ -156,7 +393,7 @@ def request_tokens_from_refresh(tenant_id, refresh_token, scope):
         "scope": scope
     }
 
-    resp = requests.post(url, data)
+    resp = http_session.post(url, data)
     if resp.status_code != 200:
         raise AzeError(
             "Unable to get access token, error {}: {} - {}".format(
@@ -175,12 +412,62 @@ def store_tokens(tokens_info, token_cache):
         return
 
     tokens_events = [create_event_from_token_info(t_info) for t_info in tokens_info]
-    for t_event in tokens_events:
-        token_cache.add(t_event)
+    token_cache.add_all(tokens_events)
+
+
+class Jwt:
+    """Raw JWT whose payload is decoded on first access and cached. Uses
+    slots to keep the memory per token low when handling many of them.
+    """
+
+    __slots__ = ("raw", "_claims")
+
+    def __init__(self, raw):
+        self.raw = raw
+        self._claims = None
+
+    @property
+    def claims(self):
+        if self._claims is None:
+            self._claims = decode_jwt_payload(self.raw)
+        return self._claims
+
+    def __getitem__(self, key):
+        return self.claims[key]
+
+    def get(self, *args, **kwargs):
+        return self.claims.get(*args, **kwargs)
+
+
+def decode_jwt_payload(token):
+    jwt_header, jwt_payload, jwt_sign = token.split(".")
+    return json.loads(base64.urlsafe_b64decode(
+        utils.add_b64_padding(jwt_payload)
+    ))
+
+def decode_jwts(tokens):
+    """Decode a batch of raw tokens, as lines of a file. Yields the token
+    and its claims, or the error that prevented decoding it.
+    """
+    for token in tokens:
+        try:
+            yield token, decode_jwt_payload(token), None
+        except (ValueError, UnicodeDecodeError) as ex:
+            yield token, None, ex
 
 
 class TokenInformation:
 
+    __slots__ = (
+        "jwt",
+        "refresh_token",
+        "id_token",
+        "_scope",
+        "_client_info",
+        "_expires_in",
+        "_ext_expires_in",
+    )
+
     def __init__(
             self,
             access_token,
@@ -191,52 +478,64 @@ class TokenInformation:
             expires_in=None,
             ext_expires_in=None,
     ):
-        self.access_token = access_token
-        jwt_header, jwt_payload, jwt_sign = access_token.split(".")
-        self._info = json.loads(base64.b64decode(
-            utils.add_b64_padding(jwt_payload)
-        ).decode())
-
+        self.jwt = access_token if isinstance(access_token, Jwt) \
+            else Jwt(access_token)
         self._scope = scope
         self.id_token = id_token
         self.refresh_token = refresh_token
+        self._client_info = client_info
+        self._expires_in = expires_in
+        self._ext_expires_in = ext_expires_in
 
-        self.tenant_id = self._info["tid"]
+    @property
+    def access_token(self):
+        return self.jwt.raw
 
-        if "upn" in self._info:
-            self.username = self._info["upn"]
-            self.account_id = self._info["oid"]
-        else:
-            self.username = self._info["appid"]
-            self.account_id = self._info["appid"]
+    @property
+    def tenant_id(self):
+        return self.jwt["tid"]
 
-        self.endpoint = aud_to_endpoint(self._info["aud"])
+    @property
+    def username(self):
+        if "upn" in self.jwt.claims:
+            return self.jwt["upn"]
+        return self.jwt["appid"]
 
-        if client_info:
-            self.client_info = client_info
-        else:
-            self.client_info = base64.b64encode(json.dumps({
-                "uid": self.account_id,
-                "utid": self.tenant_id,
-            }).encode()).decode()
+    @property
+    def account_id(self):
+        if "upn" in self.jwt.claims:
+            return self.jwt["oid"]
+        return self.jwt["appid"]
 
-        now = int(time.time())
-        if expires_in:
-            self.expires_in = expires_in
-        else:
-            self.expires_in = int(self._info["exp"]) - now
+    @property
+    def endpoint(self):
+        return aud_to_endpoint(self.jwt["aud"])
 
-        if ext_expires_in:
-            self.ext_expires_in = ext_expires_in
-        else:
-            self.ext_expires_in = self.expires_in
+    @property
+    def client_info(self):
+        if self._client_info:
+            return self._client_info
+
+        return base64.b64encode(json.dumps({
+            "uid": self.account_id,
+            "utid": self.tenant_id,
+        }).encode()).decode()
 
+    @property
+    def expires_in(self):
+        if self._expires_in:
+            return self._expires_in
+        return int(self.jwt["exp"]) - int(time.time())
+
+    @property
+    def ext_expires_in(self):
+        return self._ext_expires_in or self.expires_in
 
     def __getitem__(self,key):
-        return self._info[key]
+        return self.jwt[key]
 
     def get(self, *args, **kwargs):
-        return self._info.get(*args, **kwargs)
+        return self.jwt.get(*args, **kwargs)
 
     @property
     def scopes(self):
@@ -246,7 +545,7 @@ class TokenInformation:
             endpoint = self.endpoint
             scopes = ["{}/.default".format(endpoint)]
             try:
-                for scope in self._info["scp"].split():
+                for scope in self.jwt["scp"].split():
                     if scope in ["email", "profile", "openid"]:
                         scopes.append(scope)
                     else:
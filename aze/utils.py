@@ -1,4 +1,7 @@
+import json
+import os
 import sys
+import tempfile
 from uuid import UUID
 
 AZCLI_ID = "04b07795-8ddb-461a-bbee-02f9e1bf7b46"
@@ -10,6 +13,14 @@ def add_b64_padding(data):
 def eprint(*args, **kwargs):
     print(*args, file=sys.stderr, **kwargs)
 
+def print_target_result(target, result=None, error=None):
+    """Print the result of a target, or its error, as a JSON line."""
+    if error is not None:
+        record = {"target": target, "error": str(error)}
+    else:
+        record = {"target": target, "result": result}
+    print(json.dumps(record), flush=True)
+
 # from https://stackoverflow.com/questions/53847404/how-to-check-uuid-validity-in-python#answer-33245493
 def is_valid_uuid(uuid_to_test, version=4):
     try:
@@ -17,3 +28,31 @@ def is_valid_uuid(uuid_to_test, version=4):
     except ValueError:
         return False
     return str(uuid_obj) == uuid_to_test
+
+def atomic_write(path, content, encoding="utf-8"):
+    """Write the content to a temporary file in the same directory and
+    rename it over path, so readers never see a partially written file.
+    The permissions of the replaced file are kept.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(
+        dir=directory,
+        prefix=".{}.".format(os.path.basename(path)),
+        suffix=".tmp",
+    )
+    try:
+        with os.fdopen(fd, "w", encoding=encoding) as fo:
+            fo.write(content)
+            fo.flush()
+            os.fsync(fo.fileno())
+        try:
+            os.chmod(tmp_path, os.stat(path).st_mode & 0o777)
+        except FileNotFoundError:
+            pass
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
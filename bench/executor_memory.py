@@ -0,0 +1,88 @@
+"""Compare the peak RSS of submitting a probe per line of a big wordlist
+to a plain ThreadPoolExecutor, whose queue takes every pending future,
+and to the BoundedExecutor of the brute CLIs, where the input only
+advances as workers get free. Each executor runs in its own process,
+and the pending probes are cancelled once the input is exhausted, so
+both runs take about the same time.
+
+Run from the repository root with:
+PYTHONPATH=. python bench/executor_memory.py -n 10000000
+"""
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from aze import read_in
+from aze.executor import BoundedExecutor
+
+
+def probe(candidate, probe_time):
+    # stands in for a network request
+    time.sleep(probe_time)
+    return candidate
+
+
+def run(executor_name, path, workers, probe_time):
+    if executor_name == "bounded":
+        pool = BoundedExecutor(workers)
+    else:
+        pool = ThreadPoolExecutor(workers)
+
+    start = time.perf_counter()
+    lines = 0
+    for line in read_in.read_text_targets([path]):
+        pool.submit(probe, line, probe_time)
+        lines += 1
+    elapsed = time.perf_counter() - start
+    pool.shutdown(wait=True, cancel_futures=True)
+
+    # ru_maxrss is in KiB on Linux
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print("{:<10} {:>9} lines  peak RSS {:>8.1f} MiB  {:>7.1f}s".format(
+        executor_name, lines, peak_rss, elapsed
+    ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-n", "--lines", type=int, default=1000000)
+    parser.add_argument("-w", "--workers", type=int, default=50)
+    parser.add_argument(
+        "--probe-time",
+        type=float,
+        default=0.001,
+        help="Seconds that each probe takes.",
+    )
+    parser.add_argument("--run", choices=["unbounded", "bounded"])
+    parser.add_argument("--input")
+    args = parser.parse_args()
+
+    if args.run:
+        run(args.run, args.input, args.workers, args.probe_time)
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "candidates.txt")
+        with open(path, "w") as fo:
+            for i in range(args.lines):
+                fo.write("candidate-{}\n".format(i))
+
+        for executor_name in ("bounded", "unbounded"):
+            subprocess.run(
+                [
+                    sys.executable, __file__,
+                    "--run", executor_name,
+                    "--input", path,
+                    "--workers", str(args.workers),
+                    "--probe-time", str(args.probe_time),
+                ],
+                check=True,
+            )
+
+
+if __name__ == "__main__":
+    main()
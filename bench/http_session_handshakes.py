@@ -0,0 +1,109 @@
+"""Count the TLS handshakes needed for 1,000 requests against a local
+HTTPS stand-in, with module level requests.get (a new connection per
+request, as before) and with the shared aze.http_session.
+
+Requires the openssl command to create a self-signed certificate. Run
+from the repository root with:
+PYTHONPATH=. python bench/http_session_handshakes.py
+"""
+import argparse
+import os
+import ssl
+import subprocess
+import tempfile
+import threading
+import time
+import warnings
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import requests
+import urllib3
+from aze import http_session
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Avoid the delayed ACK stalls of sending headers and body apart
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        body = b'{"value": []}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class CountingTLSServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, context):
+        super().__init__(address, Handler)
+        self.context = context
+        self.handshakes = 0
+        self._lock = threading.Lock()
+
+    def get_request(self):
+        sock, addr = super().get_request()
+        sock = self.context.wrap_socket(sock, server_side=True)
+        with self._lock:
+            self.handshakes += 1
+        return sock, addr
+
+
+def create_certificate(directory):
+    cert = os.path.join(directory, "cert.pem")
+    key = os.path.join(directory, "key.pem")
+    subprocess.run(
+        [
+            "openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes",
+            "-keyout", key, "-out", cert, "-days", "1",
+            "-subj", "/CN=localhost",
+        ],
+        check=True,
+        capture_output=True,
+    )
+    return cert, key
+
+
+def run(server, get, requests_count):
+    server.handshakes = 0
+    start = time.perf_counter()
+    for _ in range(requests_count):
+        resp = get()
+        resp.raise_for_status()
+    elapsed = time.perf_counter() - start
+    return server.handshakes, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-n", "--requests", type=int, default=1000)
+    args = parser.parse_args()
+
+    warnings.simplefilter("ignore", urllib3.exceptions.InsecureRequestWarning)
+
+    with tempfile.TemporaryDirectory() as directory:
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(*create_certificate(directory))
+        server = CountingTLSServer(("127.0.0.1", 0), context)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = "https://127.0.0.1:{}/".format(server.server_port)
+
+        for name, get in [
+                ("requests.get", lambda: requests.get(url, verify=False)),
+                ("http_session", lambda: http_session.get(url, verify=False)),
+        ]:
+            handshakes, elapsed = run(server, get, args.requests)
+            print("{:<14} {:>5} requests {:>5} handshakes {:>7.2f}s".format(
+                name, args.requests, handshakes, elapsed
+            ))
+
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Compare the time and peak memory of parsing blob listing pages with
+the three fromstring passes used before (extract_blobs,
+extract_containers and extract_marker) and with the single pass of
+iterparse_listing. Pages are synthetic unless recorded ones are given.
+
+Run from the repository root with:
+PYTHONPATH=. python bench/listing_parse.py [page.xml ...]
+"""
+import argparse
+import io
+import time
+import tracemalloc
+from aze import storage_api
+
+BLOB_TEMPLATE = (
+    "<Blob><Name>{name}</Name><Properties>"
+    "<Creation-Time>Mon, 01 Jan 2024 00:00:00 GMT</Creation-Time>"
+    "<Last-Modified>Mon, 01 Jan 2024 00:00:00 GMT</Last-Modified>"
+    "<Etag>0x8DC0A{index:011X}</Etag>"
+    "<Content-Length>{index}</Content-Length>"
+    "<Content-Type>application/octet-stream</Content-Type>"
+    "<Content-Encoding /><Content-Language />"
+    "<Content-CRC64 /><Content-MD5>1B2M2Y8AsgTpgAmY7PhCfg==</Content-MD5>"
+    "<Cache-Control /><Content-Disposition />"
+    "<BlobType>BlockBlob</BlobType><AccessTier>Hot</AccessTier>"
+    "<AccessTierInferred>true</AccessTierInferred>"
+    "<LeaseStatus>unlocked</LeaseStatus><LeaseState>available</LeaseState>"
+    "<ServerEncrypted>true</ServerEncrypted>"
+    "</Properties><OrMetadata /></Blob>"
+)
+
+
+def gen_page(entries):
+    blobs = "".join(
+        BLOB_TEMPLATE.format(
+            name="backups/2024/01/01/file-{:06}.bin".format(i), index=i
+        )
+        for i in range(entries)
+    )
+    return (
+        '<?xml version="1.0" encoding="utf-8"?>'
+        '<EnumerationResults ContainerName="https://aze.blob.core.windows.net/bench">'
+        "<MaxResults>{}</MaxResults><Blobs>{}</Blobs>"
+        "<NextMarker>2!92!MDAwMDI0IWJhY2t1cHM-</NextMarker>"
+        "</EnumerationResults>"
+    ).format(entries, blobs).encode()
+
+
+def parse_three_passes(content):
+    text = content.decode()
+    records = list(storage_api.extract_blobs(text))
+    records.extend(storage_api.extract_containers(text))
+    marker = storage_api.extract_marker(text)
+    return records, marker
+
+
+def parse_single_pass(content):
+    return storage_api.parse_listing_page(io.BytesIO(content))
+
+
+def measure(parse, content, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        result = parse(content)
+    elapsed = (time.perf_counter() - start) / rounds
+
+    tracemalloc.start()
+    parse(content)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "page",
+        nargs="*",
+        help="Recorded listing pages. By default a synthetic page is used.",
+    )
+    parser.add_argument(
+        "-n", "--entries", type=int, default=5000,
+        help="Blobs of the synthetic page",
+    )
+    parser.add_argument("-r", "--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.page:
+        pages = []
+        for path in args.page:
+            with open(path, "rb") as fi:
+                pages.append((path, fi.read()))
+    else:
+        pages = [("synthetic", gen_page(args.entries))]
+
+    parsers = [
+        ("fromstring x3", parse_three_passes),
+        ("iterparse", parse_single_pass),
+    ]
+    for page_name, content in pages:
+        results = []
+        for name, parse in parsers:
+            result, elapsed, peak = measure(parse, content, args.rounds)
+            results.append(result)
+            print("{} {:<14} {:>6} records {:>8.1f} ms {:>8.1f} MiB peak".format(
+                page_name, name, len(result[0]),
+                elapsed * 1000, peak / 1024 / 1024
+            ))
+        if results[0] != results[1]:
+            print("{} records differ between parsers".format(page_name))
+
+
+if __name__ == "__main__":
+    main()
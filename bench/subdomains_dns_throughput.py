@@ -0,0 +1,129 @@
+"""Compare the throughput of the thread and asyncio resolution engines of
+az-brute-service-subdomains against a local stub DNS server, that
+answers NXDOMAIN to every query after a fixed latency, as a remote
+resolver would.
+
+Run from the repository root with:
+PYTHONPATH=. python bench/subdomains_dns_throughput.py
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import logging
+import socket
+import threading
+import time
+import dns.message
+import dns.rcode
+import dns.resolver
+from aze import az_brute_service_subdomains as subdomains
+from aze.dns_cache import DnsResolutionCache
+from aze.executor import BoundedExecutor
+
+ZONE = "blob.core.windows.net"
+
+
+class StubDnsProtocol(asyncio.DatagramProtocol):
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.queries = 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+        sock = transport.get_extra_info("socket")
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+
+    def datagram_received(self, data, addr):
+        self.queries += 1
+        response = dns.message.make_response(dns.message.from_wire(data))
+        response.set_rcode(dns.rcode.NXDOMAIN)
+        asyncio.get_running_loop().call_later(
+            self.latency, self.transport.sendto, response.to_wire(), addr
+        )
+
+
+def start_stub_server(latency):
+    loop = asyncio.new_event_loop()
+    ready = threading.Event()
+    state = {}
+
+    async def serve():
+        transport, protocol = await loop.create_datagram_endpoint(
+            lambda: StubDnsProtocol(latency),
+            local_addr=("127.0.0.1", 0),
+        )
+        state["port"] = transport.get_extra_info("sockname")[1]
+        state["protocol"] = protocol
+        ready.set()
+
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    asyncio.run_coroutine_threadsafe(serve(), loop)
+    ready.wait()
+    return state["port"], state["protocol"]
+
+
+def gen_candidates(count):
+    for i in range(count):
+        yield "aze-bench-{}".format(i), ZONE
+
+
+def run_threads(port, count, workers):
+    resolver = dns.resolver.Resolver(configure=False)
+    resolver.nameservers = ["127.0.0.1"]
+    resolver.port = port
+    cache = DnsResolutionCache()
+    print_lock = threading.Lock()
+    with BoundedExecutor(workers) as pool:
+        for subdomain, zone in gen_candidates(count):
+            pool.submit(
+                subdomains.dns_resolution,
+                subdomain, zone, resolver, False, print_lock, cache,
+            )
+
+
+def run_async(port, count, concurrency):
+    resolver = subdomains.AsyncRateLimitedResolver("127.0.0.1", 5)
+    resolver.resolver.port = port
+    asyncio.run(subdomains.async_resolve_candidates(
+        gen_candidates(count),
+        [resolver],
+        False,
+        concurrency,
+        DnsResolutionCache(),
+    ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-n", "--queries", type=int, default=2000)
+    parser.add_argument(
+        "-l", "--latency", type=float, default=0.01,
+        help="Seconds the stub server takes to answer",
+    )
+    args = parser.parse_args()
+
+    # Timeouts are reported in the results, not one by one
+    logging.getLogger("aze").setLevel(logging.ERROR)
+
+    port, stub = start_stub_server(args.latency)
+    engines = [
+        ("threads (2)", lambda: run_threads(port, args.queries, 2)),
+        ("threads (50)", lambda: run_threads(port, args.queries, 50)),
+        ("async (100)", lambda: run_async(port, args.queries, 100)),
+        ("async (500)", lambda: run_async(port, args.queries, 500)),
+    ]
+    for name, run in engines:
+        stub.queries = 0
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            run()
+        elapsed = time.perf_counter() - start
+        print("{:<13} {:>6} queries {:>7.2f}s {:>8.0f} queries/s".format(
+            name, stub.queries, elapsed, stub.queries / elapsed
+        ))
+
+
+if __name__ == "__main__":
+    main()
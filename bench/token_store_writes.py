@@ -0,0 +1,107 @@
+"""Count the writes to the token cache file when importing N tokens with
+an add per event, as before, and with a single store_tokens batch. The
+tokens are synthetic unsigned JWTs and each run uses an empty cache in
+a temporary directory.
+
+Run from the repository root with:
+PYTHONPATH=. python bench/token_store_writes.py -n 500
+"""
+import argparse
+import base64
+import json
+import os
+import tempfile
+import time
+from msal_extensions import FilePersistence, PersistedTokenCache
+from aze import tokens
+from aze import utils
+
+
+class CountingPersistence(FilePersistence):
+
+    def __init__(self, location):
+        super().__init__(location)
+        self.writes = 0
+
+    def save(self, content):
+        self.writes += 1
+        super().save(content)
+
+
+def b64url(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def gen_tokens(count):
+    header = b64url(json.dumps({"alg": "none", "typ": "JWT"}).encode())
+    for i in range(count):
+        claims = {
+            "aud": "https://graph.microsoft.com",
+            "tid": "00000000-0000-0000-0000-{:012}".format(i % 10),
+            "oid": "11111111-0000-0000-0000-{:012}".format(i),
+            "upn": "user{}@aze.onmicrosoft.com".format(i),
+            "scp": "User.Read Directory.Read.All",
+            "exp": int(time.time()) + 3600,
+        }
+        payload = b64url(json.dumps(claims).encode())
+        yield tokens.TokenInformation("{}.{}.".format(header, payload))
+
+
+def build_cache(directory):
+    persistence = CountingPersistence(
+        os.path.join(directory, "msal_token_cache.json")
+    )
+    token_cache = tokens.IndexedTokenCache(
+        PersistedTokenCache(persistence), persistence
+    )
+    return token_cache, persistence
+
+
+def count_writes(import_tokens, tokens_info):
+    with tempfile.TemporaryDirectory() as directory:
+        token_cache, persistence = build_cache(directory)
+        location = persistence.get_location()
+
+        # store_tokens writes plain caches with atomic_write
+        atomic_write = utils.atomic_write
+
+        def counting_atomic_write(path, *args, **kwargs):
+            if path == location:
+                persistence.writes += 1
+            return atomic_write(path, *args, **kwargs)
+
+        utils.atomic_write = counting_atomic_write
+        try:
+            start = time.perf_counter()
+            import_tokens(tokens_info, token_cache)
+            elapsed = time.perf_counter() - start
+        finally:
+            utils.atomic_write = atomic_write
+
+        entries = len(token_cache.find(tokens.CredentialType.ACCESS_TOKEN))
+        return persistence.writes, entries, elapsed
+
+
+def add_per_event(tokens_info, token_cache):
+    for t_info in tokens_info:
+        token_cache.add(tokens.create_event_from_token_info(t_info))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-n", "--tokens", type=int, default=500)
+    args = parser.parse_args()
+
+    tokens_info = list(gen_tokens(args.tokens))
+    for name, import_tokens in [
+            ("add per event", add_per_event),
+            ("store_tokens", tokens.store_tokens),
+    ]:
+        writes, entries, elapsed = count_writes(import_tokens, tokens_info)
+        print("{:<14} {:>6} tokens {:>7} writes {:>8.2f}s".format(
+            name, entries, writes, elapsed
+        ))
+
+
+if __name__ == "__main__":
+    main()
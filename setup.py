@@ -37,6 +37,9 @@ scripts = [
     "az-list-vm-extensions",
     "az-list-vm-permissions",
     "az-login-with-token",
+    "az-membership-graph",
+    "az-mirror-blobs",
+    "az-refresh-tokens",
     "az-search-token-in-cache",
     "az-show-ad-role",
     "az-show-administrative-unit",